@@ -1,109 +1,107 @@
+import os
 import serial
-import time
+import threading
 
 # Set the correct serial port (e.g., '/dev/ttyACM0')
-arduino_port = '/dev/ttyACM0'  
+# BLP_SERIAL_PORT points it elsewhere, e.g. at arduino_emulator's pty
+arduino_port = os.environ.get('BLP_SERIAL_PORT', '/dev/ttyACM0')
 baud_rate = 9600  # Match the baud rate to the Arduino
 
-# Open the serial connection to the Arduino
-try:
-    ser = serial.Serial(arduino_port, baud_rate, timeout=1)
-    print(f"Connected to Arduino on port {arduino_port}")
-except serial.SerialException as e:
-    print(f"Error connecting to the Arduino: {e}")
-    exit()
+SETTLE_TIME = 2  # the Arduino resets when the port opens
 
-time.sleep(2)  # Wait for the connection to establish
+class LinkDropped(serial.SerialException):
+    """The port is closed, vanished, or stopped answering polls."""
+
+# The protocol itself is transport.TelemetryLink over a SerialTransport,
+# the same code every other link runs; this module keeps one of them.
+# Opened on first use (or by connect()), never at import, so importing
+# this module is instant and touches no hardware.
+link = None
+_opened = False
+
+# Poll all channels with one BULK_POLL byte and one framed reply, and send
+# each command as one framed write that the device acks by sequence number.
+# connect() probes for both once the Arduino is up, so older firmware gets
+# per-channel polls and the paced byte-at-a-time commands from the start.
+BULK_MODE = True
+COMMAND_FRAMED = True
+
+# Held while the port is opened or closed, so no poll or command runs on a
+# link that is being replaced.
+lock = threading.RLock()
+
+def connect():
+    """
+    (Re)open the serial port, wait SETTLE_TIME for the Arduino and probe
+    its protocol.  Raises serial.SerialException if the port is not there.
+    """
+    global link, _opened
+    from transport import Link, SerialTransport
+    with lock:
+        _opened = True
+        if link is None:
+            link = Link(SerialTransport(arduino_port, baud_rate, settle=SETTLE_TIME),
+                        bulk=BULK_MODE, framed=COMMAND_FRAMED)
+            link.start()
+        else:
+            link.reconnect()
+        print(f"Connected to Arduino on port {arduino_port}")
+    return link
+
+reconnect = connect
+
+def close():
+    global link
+    with lock:
+        if link is not None:
+            try:
+                link.stop()
+            except (OSError, serial.SerialException):
+                pass
+            link = None
+
+def _link():
+    with lock:
+        if not _opened:
+            # first poll or command opens the port; if that fails,
+            # supervisor.Supervisor keeps retrying through reconnect()
+            try:
+                connect()
+            except (OSError, serial.SerialException) as e:
+                print(f"Error connecting to the Arduino: {e}")
+        if link is None or not link.transport.is_open:
+            raise LinkDropped("serial port is not open")
+        return link
 
 def send_message(message):
     """
     Send a message one character at a time to the Arduino
     with delimiters as per the request (e.g., "[" "H" "," "e" ",").
     """
-    ser.reset_output_buffer()
-    for char in message:
-        # Send '['
-        ser.write('['.encode())
-        #print(f"Sent: [")
-        time.sleep(0.05)
-        
-        # Send the character
-        #print(type(char))
-        #print(char)
-        ser.write(str(char).encode())
-        #print(f"Sent: {char}")
-        time.sleep(0.05)
-        
-        # Send ','
-        ser.write(','.encode())  
-        #print(f"Sent: ,")
-        time.sleep(0.05)
+    _link().send_message(message)
+
+def send_command(packet, payload=None):
+    """
+    Send a whole data packet with a single write and wait for the ack.
+    payload is the packet's precomputed frames.encode_legacy_command().
+    Returns (seq, wire_latency, ack_latency) in seconds.  seq and
+    ack_latency are None when the packet went out on the legacy protocol.
+    """
+    return _link().send_command(packet, payload)
+
+def receive_frame():
+    """
+    Poll every channel with a single request.
+    Returns (seq, device_ms, values) decoded from one framed packet.
+    """
+    return _link().receive_frame()
 
 def receive_response():
     """
-    Receive data from the Arduino.
-    This function reads the response one character at a time.
+    Receive one sample of every channel from the Arduino as a list of floats
+    [OPD_01, OPD_02, EPD_01, FPD_01, FPD_02, THRUST].
     """
-    #print('Recieving Response')
-    rx_data = []
-    ser.reset_input_buffer()
-    ser.write(b'5')
-  
-    
-    opd01_response = ser.readline().decode('latin1').strip()
-    
-    #print('here')
-    #print(opd01_response)
-
-    '''
-    print(type(opd01_response))
-    
-    These valuescomefromthe arduino as strings so they need to
-    be converted.
-    '''
-    opd01_response = float(opd01_response)
-    #print('here2')
-    rx_data.append(opd01_response)
-    ser.write(b'6')
-    
-    opd02_response = ser.readline().decode('Latin1').strip()
-    opd02_response = float(opd02_response)
-    rx_data.append(opd02_response)
-    ser.write(b'7')
-    
-    epd01_response = ser.readline().decode('Latin1').strip()
-    epd01_response = float(epd01_response)
-    rx_data.append(epd01_response)
-    
-    ser.write(b'8')
-    fpd01_response = ser.readline().decode('Latin1').strip()
-    fpd01_response = float(fpd01_response)
-    rx_data.append(fpd01_response)
-    
-    ser.write(b'A')
-    fpd02_response = ser.readline().decode('Latin1').strip()
-    fpd02_response = float(fpd02_response)
-    rx_data.append(fpd02_response)
-   
-    ser.write(b'&')
-    thrust_response = ser.readline().decode('Latin1').strip()
-    thrust_response = float(thrust_response)
-    rx_data.append(thrust_response)
-    
-    
-    
-    
-   
-    
-    return rx_data
-    '''
-    for i in range(30):  # Check if data is available
-        #received_char = ser.read().decode('Latin1')  # Read one byte
-        received_char = ser.read()  # Read one byte
-        print('HERE')
-        rx_data.append(received_char)
-    return rx_data
-    '''
+    return _link().receive_response()
 '''
 def main():
     try:
@@ -118,7 +116,7 @@ def main():
         print("Communication terminated by user.")
     finally:
         if ser.is_open:
-            ser.close()  # Close the serial port when done
+            close()  # Close the serial port when done
             print("Serial port closed.")
 
 if __name__ == "
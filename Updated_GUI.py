@@ -2,15 +2,24 @@
 
 import tkinter as tk
 from tkinter import filedialog, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-import pandas as pd
-# import os
+# matplotlib and pandas are imported where first used, so the window
+# (and its ABORT button) is up before they finish loading
+import os
+import queue
+import threading
 # import socket
 import time
 from pycode import Telemetry, System_Health, Metrics
-from pycode import V1, V2, V3, V4, C, T, CS, A
+from pycode import V1, V2, V3, V4
+from plotting import BlitRenderer, Dashboard, RenderScheduler
+from decimate import MinMaxDecimator, minmax_decimate
+from catalog import Catalog
+from channel_store import ChannelStore
+from daemon import DaemonError, RemoteTelemetry, parse_address
+from recorder import Recorder, recording_path
+from redline import REDLINES, Redlines
+from sequencer import Sequencer, SequenceError, compile_sequence, describe, load_sequence
+from frames import CHANNELS
 
 
 # from serial_pc import BT
@@ -18,11 +27,52 @@ from pycode import V1, V2, V3, V4, C, T, CS, A
 # import datetime
 # import json
 
+# Redraw only the plot lines over a cached background each tick, rescaling
+# only when data leaves the axes; False does a full canvas.draw() per plot.
+BLIT = True
+
+# Draw every channel on one figure with a shared time axis (one
+# rasterization and one Tk blit per frame) instead of a canvas per sensor.
+# DASHBOARD_LAYOUT is (channel, title, y label), filled row by row.
+DASHBOARD = True
+DASHBOARD_COLUMNS = 3
+DASHBOARD_LAYOUT = [
+    ("THRUST", "Thrust", "Thrust (lbf)"),
+    ("OPD_01", "OPD_01", "Pressure (PSI)"),
+    ("OPD_02", "OPD_02", "Pressure (PSI)"),
+    ("EPD_01", "EPD_01", "Pressure (PSI)"),
+    ("FPD_01", "FPD_01", "Pressure (PSI)"),
+    ("FPD_02", "FPD_02", "Pressure (PSI)"),
+]
+
+# Widget updates requested by the sequencer thread are applied this often.
+UI_POLL_MS = 10
+
+# valve named on each button, by its data packet slot
+VALVE_NAMES = {V1: 'FV-02', V2: 'FV-03', V3: 'OV-03', V4: 'NV-02'}
+
+# Samples are drained, logged and checked every ACQUISITION_PERIOD_MS; the
+# plots are redrawn separately at RENDER_FPS from whatever has accumulated.
+ACQUISITION_PERIOD_MS = 20
+RENDER_FPS = 30
+
+# Whole-run plots are min/max decimated to about PLOT_POINTS points (roughly
+# one per pixel column) so peaks survive; the shorter views zoom in on the
+# most recent seconds at full resolution.
+PLOT_POINTS = 1000
+VIEW_WINDOWS = {"All": None, "60 s": 60, "30 s": 30, "10 s": 10}
+
+# None keeps the whole run in memory; a sample count keeps only that many
+# of the most recent samples in a fixed-size ring.
+STORE_CAPACITY = None
+
 # ---------- Fake Telemetry for Simulation Testing ----------
 class FakeTelemetry:
     def __init__(self, sys):
         print("FakeTelemetry: Initialized (Simulation Mode).")
         self.counter = 0
+        self.metrics = Metrics()
+        self.data_packet = [0, 0, 0, 0, 0, 0, 0, 0]
 
     def start_test(self):
         print("FakeTelemetry: Test started.")
@@ -30,6 +80,10 @@ class FakeTelemetry:
     def send_data(self):
         print("FakeTelemetry: Data sent.")
 
+    def send_packet(self, packet, payload=None):
+        self.data_packet = list(packet)
+        print(f"FakeTelemetry: Packet sent {payload or packet}.")
+
     def abort(self):
         print("FakeTelemetry: Test aborted.")
 
@@ -42,6 +96,15 @@ class FakeTelemetry:
     def upload_test_sequence(self, file_path):
         print(f"FakeTelemetry: Uploaded test sequence from {file_path}")
 
+    def start_stream(self, capacity=4096, period=0.0, on_sample=None):
+        print("FakeTelemetry: Stream started.")
+
+    def stop_stream(self):
+        print("FakeTelemetry: Stream stopped.")
+
+    def get_samples(self):
+        return [(time.time(), self.get_data())]
+
     def get_data(self):
         self.counter += 1
         # Cycle thrust between 0 and 200 lbf
@@ -59,19 +122,9 @@ class FakeTelemetry:
 # ---------- Main GUI Class ----------
 class GUI:
     def __init__(self):
-        # Data storage for graphs
-        self.thrust_data = []
-        self.pt1_data = []
-        self.pt2_data = []
-        self.pt3_data = []
-        self.pt4_data = []
-        self.pt5_data = []
-
-        # all_data will hold rows of [ pt1, pt2, pt3, pt4, pt5,thrust,]
-        self.all_data = []
-        
-        # All times
-        self.times =[]
+        # Data storage for graphs, warnings and export: sample times plus one
+        # column per channel [OPD_01, OPD_02, EPD_01, FPD_01, FPD_02, THRUST]
+        self.store = ChannelStore(CHANNELS, capacity=STORE_CAPACITY)
 
         # Placeholders for plot elements
         self.thrust_fig = self.thrust_ax = self.thrust_canvas = self.thrust_line = None
@@ -80,6 +133,13 @@ class GUI:
         self.pt3_fig = self.pt3_ax = self.pt3_canvas = self.pt3_line = None
         self.pt4_fig = self.pt4_ax = self.pt4_canvas = self.pt4_line = None
         self.pt5_fig = self.pt5_ax = self.pt5_canvas = self.pt5_line = None
+        # BlitRenderer and MinMaxDecimator for each plot, keyed by its line
+        self.renderers = {}
+        self.dashboard = None
+        self.decimators = {}
+        self.plot_lines = {}  # channel -> line
+        self.view_window = None
+        self.view_menu = None
 
         self.chart_canvas = None
         self.PT5_label = None
@@ -103,15 +163,35 @@ class GUI:
         self.warning_label = None
         self.start_time = None
         self.after_id = None  # for cancelling .after() updates
+        self.render_label = None
+        self.sequencer = None
+        self.recorder = None  # the run on disk, written as it is acquired
+        self.run_active = False  # between START and the end of that run
+        # what the run catalog notes about the run when it ends
+        self.abort_reason = None
+        self.watching_abort = False  # until the abort thread has sent every stage
+        self.sequence_path = self.sequence_steps = None
+        # with a daemon the stand catalogs its own runs
+        self.catalog = None if isinstance(tel, RemoteTelemetry) else Catalog()
+        # limit checks run on the acquisition thread and can abort from there
+        self.redlines = Redlines(REDLINES, on_abort=self.redline_abort, metrics=tel.metrics)
+        # widget updates posted from the sequencer thread, run on the Tk loop
+        self.ui_calls = queue.SimpleQueue()
 
         self.window = tk.Tk()
         self.window.title("BLP GUI")
         self.window.geometry('1000x1000')
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         for i in range(5):
             self.window.columnconfigure(i, weight=1, uniform="col")
 
         self.valve_status = {'NV-02': 0, 'FV-02': 0, 'FV-03': 0, 'OV-03': 0}
         self.widgets()
+        # plots once the controls have been drawn, see create_plots()
+        self.window.after_idle(self.window.after, 0, self.create_plots)
+        self.drain_ui()
+        self.render_scheduler = RenderScheduler(self.window, self.update_graphs,
+                                                fps=RENDER_FPS, metrics=tel.metrics)
 
     def widgets(self):
         # Timer label
@@ -119,6 +199,17 @@ class GUI:
                                     font=("Times New Roman", 15), fg="black")
         self.timer_label.grid(row=1, column=3, sticky="w", padx=5, pady=5)
 
+        # Render stats label
+        self.render_label = tk.Label(self.window, text="",
+                                     font=("Times New Roman", 12), fg="gray")
+        self.render_label.grid(row=1, column=4, sticky="e", padx=5, pady=5)
+
+        # Plot view: whole run (decimated) or the most recent seconds
+        self.view_window = tk.StringVar(value="All")
+        self.view_menu = tk.OptionMenu(self.window, self.view_window, *VIEW_WINDOWS)
+        self.view_menu.config(font=("Times New Roman", 15))
+        self.view_menu.grid(row=3, column=0, sticky="w", padx=5, pady=5)
+
         # Warning label
         self.warning_label = tk.Label(self.window, text=" ",
                                       font=("Times New Roman", 15), fg="red")
@@ -191,6 +282,15 @@ class GUI:
                                       command=self.abort)
         self.abort_button.grid(row=1, column=2, sticky="nsew", padx=5, pady=5)
 
+    def create_plots(self):
+        # matplotlib is the slowest thing to load, so the plots are built
+        # after the rest of the window is up rather than holding it back
+        if self.plot_lines:
+            return
+        if DASHBOARD:
+            self.create_dashboard()
+            return
+
         # Labels for graphs
         self.thrust_label = tk.Label(self.window,
                                      text="Thrust",
@@ -247,8 +347,24 @@ class GUI:
             self.create_plot(row=8, column=2, xlabel="Time (s)", ylabel="Pressure (PSI)", data=[])
         self.pt5_fig, self.pt5_ax, self.pt5_canvas, self.pt5_line = \
             self.create_plot(row=8, column=4, xlabel="Time (s)", ylabel="Pressure (PSI)", data=[])
+        self.plot_lines = dict(zip(CHANNELS, (self.pt1_line, self.pt2_line, self.pt3_line,
+                                              self.pt4_line, self.pt5_line, self.thrust_line)))
+
+    def create_dashboard(self):
+        self.dashboard = Dashboard(self.window, DASHBOARD_LAYOUT,
+                                   columns=DASHBOARD_COLUMNS, blit=BLIT)
+        canvas_widget = self.dashboard.canvas.get_tk_widget()
+        canvas_widget.grid(row=5, column=0, rowspan=4, columnspan=6, sticky="nsew", padx=5, pady=5)
+        self.plot_lines = {channel: self.dashboard.lines[channel] for channel in CHANNELS
+                           if channel in self.dashboard.lines}
+        for line in self.plot_lines.values():
+            self.decimators[line] = MinMaxDecimator(PLOT_POINTS // 2)
+        self.dashboard.canvas.draw()
 
     def create_plot(self, row, column, xlabel, ylabel, data):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
         fig = Figure(figsize=(5, 3), dpi=100)
         ax = fig.add_subplot(111)
         ax.set_xlabel(xlabel, fontsize=10)
@@ -263,20 +379,71 @@ class GUI:
         canvas = FigureCanvasTkAgg(fig, master=self.window)
         canvas_widget = canvas.get_tk_widget()
         canvas_widget.grid(row=row, column=column, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.decimators[line] = MinMaxDecimator(PLOT_POINTS // 2)
+        if BLIT:
+            renderer = BlitRenderer(canvas)
+            renderer.add(ax, line)
+            self.renderers[line] = renderer
         canvas.draw()
         return fig, ax, canvas, line
 
     def start(self):
+        if self.run_active:
+            # START then a sequence's Start_Count: one run, one time base
+            print("Test already running")
+            return
         print("Test started")
+        self.create_plots()  # in case Start beat the deferred build
+        self.run_active = True
         self.start_time = time.time()  
+        # every sample time is from this run's start, so the last run's
+        # samples and plot buckets go
+        self.store.clear()
+        for line in self.decimators:
+            self.decimators[line] = MinMaxDecimator(PLOT_POINTS // 2)
         #print('record test start time')
-        self.update_graphs()  # start telemetry update loop
+        if self.recorder is not None:
+            self.recorder.close()
+        # a daemon records (and exports and catalogs) the run itself
+        if not isinstance(tel, RemoteTelemetry):
+            self.recorder = Recorder(recording_path(), start_time=self.start_time, metrics=tel.metrics)
+            print(f"Recording to {self.recorder.path}")
+        self.abort_reason = None
+        self.redlines.reset()
+        # sample on the acquisition thread, not the Tk loop; redlines are checked there too
+        tel.start_stream(on_sample=self.redlines.check_sample)
+        if self.after_id:
+            self.window.after_cancel(self.after_id)  # already running
+        self.update_data()  # start telemetry update loop
+        self.render_scheduler.start()
         self.start_button.config(background="green")
         #self.abort_button.config(background="red")
 
     def abort(self):
+        self.send_abort("operator abort")
+        self.finish_abort()
+
+    def send_abort(self, reason):
+        # the abort packets themselves, sent from the abort thread ahead of
+        # anything else; safe to call from the sequencer thread
         tel.abort()
-        tel.send_data()
+        if self.abort_reason is None:
+            self.abort_reason = reason
+        if self.sequencer is not None:
+            self.sequencer.stop()
+
+    def close(self):
+        # closing the window mid-run still leaves a complete, catalogued recording
+        self.end_run()
+        self.window.destroy()
+
+    def redline_abort(self, limit, t, value):
+        # on the acquisition thread: abort now, leave the widgets to the Tk loop
+        print(f"Redline abort: {limit.message or limit.name} ({limit.channel}={value:g})")
+        self.send_abort(f"redline {limit.name} ({limit.channel}={value:g})")
+        self.run_on_ui(self.finish_abort)
+
+    def finish_abort(self):
         self.OV03_button.config(bg="red")
         self.valve_status['OV-03'] = 0
         self.FV03_button.config(bg="red")
@@ -287,81 +454,151 @@ class GUI:
         self.valve_status['NV-02'] = 0
         self.test_running = False # Stop the test sequence
         print("Manual Test aborted")
+        if not self.watching_abort:
+            self.watching_abort = True
+            self.watch_abort()
+        # a redline and the ABORT button (or BLP_Abort) may both finish the
+        # same run; it is saved once
+        saved = self.end_run()
+        if saved == (None, None):
+            messagebox.showinfo("Test Data Saved", "The stand daemon is saving the run")
+        elif saved:
+            path, export = saved
+            messagebox.showinfo("Test Data Saved", f"All telemetry data has been recorded to {path}; "
+                                                   f"{export} is being written")
+
+    def valve_button(self, name):
+        return getattr(self, name.replace('-', '') + '_button')
+
+    def watch_abort(self):
+        # the valves above show what the abort commands; if a stage never
+        # went out, say so and mark the valves it left uncommanded
+        aborter = getattr(tel, 'aborter', None)
+        if aborter is None:
+            self.watching_abort = False
+            return
+        if not aborter.done.is_set():
+            self.window.after(UI_POLL_MS, self.watch_abort)
+            return
+        self.watching_abort = False
+        valves = [VALVE_NAMES[slot] for slot in aborter.unconfirmed() if slot in VALVE_NAMES]
+        if not valves:
+            return
+        for name in valves:
+            self.valve_button(name).config(bg="orange")
+        messagebox.showerror("ABORT NOT CONFIRMED",
+                             f"The abort could not command {', '.join(valves)}: "
+                             f"{System_Health.py_stats.get('abort')}.\n"
+                             "Their state is unknown; safe the stand by hand.")
+
+    def end_run(self):
+        """
+        Stop acquiring, close the recording, and export and catalog the run
+        on a background thread.  Returns (recording path, export path), both
+        None with a daemon, which saves the run itself, or None when no run
+        is active.
+        """
+        if not self.run_active:
+            return None
+        self.run_active = False
 
         # Stop the update loop
-        if hasattr(self, "after_id") and self.after_id:
+        if self.after_id:
             self.window.after_cancel(self.after_id)
-
-        # Save data to CSV
-        self.save_data_to_csv()
-
-        # Optionally, show a message
-        messagebox.showinfo("Test Data Saved", "All telemetry data has been saved to test_data.csv")
+            self.after_id = None
+        self.render_scheduler.stop()
+        self.ingest(tel.get_samples())  # what came in since the last tick
+        tel.stop_stream()
+        tel.metrics.report()
+        if isinstance(tel, RemoteTelemetry):
+            self.sequence_path = self.sequence_steps = None
+            return None, None
+
+        # The recording is already on disk; closing it only writes the last block
+        path = self.recorder.close() if self.recorder is not None else None
+        self.recorder = None
+        export = recording_path(when=self.start_time, suffix='.csv')
+        # this run's samples, copied: the next START clears the store
+        times = self.store.times.copy()
+        channels = {sensor: (times, self.store.column(sensor).copy()) for sensor in CHANNELS}
+        run = {'start_time': self.start_time, 'abort_reason': self.abort_reason,
+               'sequence': self.sequence_path, 'steps': self.sequence_steps}
+        self.sequence_path = self.sequence_steps = None
+        # Legacy CSV export and cataloging off the Tk loop
+        threading.Thread(target=self.save_run, args=(path, export, channels), kwargs=run,
+                         name="csv export", daemon=False).start()
+        return path, export
+
+    def run_on_ui(self, func, *args, **kwargs):
+        # Tk may only be touched from its own thread
+        self.ui_calls.put((func, args, kwargs))
+
+    def drain_ui(self):
+        while True:
+            try:
+                func, args, kwargs = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args, **kwargs)
+        self.window.after(UI_POLL_MS, self.drain_ui)
 
     def upload_file(self):
+        # These run on the sequencer thread and hand widget changes to the
+        # Tk loop.  Valve and spark packets are precomputed by
+        # compile_sequence() and sent just before their function here runs.
         def Start_Count():
-            self.start()
+            self.run_on_ui(self.start)
+            return "count started"
 
         def BLP_Abort():
-            self.abort()
+            self.send_abort("sequence BLP_Abort")
+            self.run_on_ui(self.finish_abort)
             # self.test_running = False Stop the test sequence
             return "Test aborted and data saved"
 
+        # the low-pressure aborts these used to check once are redlines (redline.py),
+        # checked on every sample from here on
         def Read_OPD_02():
-            print(self.pt1_data)
-             #if self.pt1_data and self.pt1_data[-1] < 15:
-                     #return BLP_Abort()
-            return ("OPD_02 within safe range")
+            self.redlines.arm("OPD_02")
+            return ("OPD_02 redline armed")
 
         def Read_FPD_02():
-             #if self.pt2_data and self.pt2_data[-1] < 15:
-                 #return BLP_Abort()
-            return ("FPD_02 within safe range")
+            self.redlines.arm("FPD_02")
+            return ("FPD_02 redline armed")
 
         def Read_EPD_01():
-             #if self.pt3_data and self.pt3_data[-1] < 15:
-                 #return BLP_Abort()
-            return ("EPD_01 within safe range")
+            self.redlines.arm("EPD_01")
+            return ("EPD_01 redline armed")
 
         def FV_02_Close():
-            tel.close_valve(V1)
-            tel.send_data()
-            self.FV02_button.config(bg="red")
+            self.run_on_ui(self.FV02_button.config, bg="red")
             self.valve_status['FV-02'] = 0
             if self.valve_status["FV-02"] == 1:
                 return BLP_Abort()
             return ("FV-02 closed")
 
         def NV_02_Open():
-            tel.open_valve(V4)
-            tel.send_data()
-            self.NV02_button.config(bg="green")
+            self.run_on_ui(self.NV02_button.config, bg="green")
             self.valve_status['NV-02'] = 1
             if self.valve_status["NV-02"] == 0:
                 return BLP_Abort()
             return ("NV-02 opened")
 
         def OV_03_Open():
-            tel.open_valve(V3)
-            tel.send_data()
-            self.OV03_button.config(bg="green")
+            self.run_on_ui(self.OV03_button.config, bg="green")
             self.valve_status['OV-03'] = 1
             if self.valve_status["OV-03"] == 0:
                 return BLP_Abort()
             return ("OV-03 opened")
 
         def FV_03_Open():
-            tel.open_valve(V2)
-            tel.send_data()
-            self.FV03_button.config(bg="green")
+            self.run_on_ui(self.FV03_button.config, bg="green")
             self.valve_status['FV-03'] = 1
             if self.valve_status["FV-03"] == 0:
                 return BLP_Abort()
             return ("FV_03 opened")
 
         def Spark():                             #Spark function needs to be fixed
-            tel.spark_coil()
-            tel.send_data()
             return('spark sent')
                 
                  #while current_time < spark_time:
@@ -382,50 +619,37 @@ class GUI:
         }
 
         file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
-        if file_path:
+        if file_path and isinstance(tel, RemoteTelemetry):
+            # the daemon compiles and runs the sequence; this window only follows along
+            print(f"Selected file: {file_path}")
+            try:
+                tel.run_sequence(load_sequence(file_path))
+            except (SequenceError, DaemonError) as e:
+                messagebox.showerror("Sequence rejected", str(e))
+                return
+            self.start()
+        elif file_path:
             
             print(f"Selected file: {file_path}")
             try:
-                # Read and sort the test sequence
-                df = pd.read_csv(file_path)
-                test_sequence = list(zip(df['Time'], df['Function']))
-                
-                #print(test_sequence)
-
+                # Check the whole sequence and precompute its packets before the count
+                steps = load_sequence(file_path)
+                test_sequence = compile_sequence(steps, function_map,
+                                                 send=tel.send_packet, packet=tel.data_packet,
+                                                 current=lambda: tel.data_packet)
+                print(describe(test_sequence))
+                self.sequence_path, self.sequence_steps = file_path, steps
+            except SequenceError as e:
+                messagebox.showerror("Sequence rejected", str(e))
+                return
+            try:
                 # Initialize test state
                 self.test_running = True
                 self.test_start_time = time.time()
-                self.current_step = 0
-
-                def execute_test_step():
-                    if not self.test_running: 
-                        return 0
-                    if self.current_step >= len(test_sequence):
-                        return 0
-                        
-                    current_time = time.time() - self.test_start_time
-                    target_time, function = test_sequence[self.current_step]
-
-                    # If it's time to execute this step
-                    if current_time >= target_time and self.test_running:
-                        func = function_map.get(function)
-                        if func:
-                            try:
-                                result = func()
-                                print(f"Executed {function} at {current_time:.3f}s: {result}")
-                                
-                            except Exception as e:
-                                print(f"Error executing {function}: {e}")
-                                self.test_running = False
-
-                        self.current_step += 1
-
-                    # Schedule next check
-                    if self.test_running:
-                        self.window.after(10, execute_test_step)  # Check every 10ms
-
-                # Start the test sequence
-                execute_test_step()
+
+                # Start the test sequence on its own deadline-driven thread
+                self.sequencer = Sequencer(function_map, metrics=tel.metrics)
+                self.sequencer.start(test_sequence)
 
             except Exception as e:
                 print(f"Error loading file: {e}")
@@ -434,6 +658,22 @@ class GUI:
     
 
     def toggle_valve(self, name):
+        # open_valve()/close_valve() edit the live packet before it is sent;
+        # if the send is refused (an abort is in progress, or the link is
+        # down) put the packet back, so neither it nor the buttons claim a
+        # valve state that was never commanded
+        previous = getattr(tel, 'data_packet', None)
+        previous = None if previous is None else list(previous)
+        try:
+            self._toggle_valve(name)
+        except Exception as e:
+            if previous is not None:
+                tel.data_packet = previous
+            print(f"Valve command refused: {e}")
+            messagebox.showwarning("Command Refused",
+                                   f"{VALVE_NAMES.get(name, name)} was not toggled: {e}")
+
+    def _toggle_valve(self, name):
         if name == V4 and self.valve_status['NV-02'] == 0:
             tel.open_valve(V4)
             tel.send_data()
@@ -485,56 +725,93 @@ class GUI:
         else:
             print("Error toggling valve")
 
-    def update_graphs(self):
-        new_data = tel.get_data()
+    def show_valves(self, status):
+        buttons = {'NV-02': self.NV02_button, 'FV-02': self.FV02_button,
+                   'FV-03': self.FV03_button, 'OV-03': self.OV03_button}
+        for name, is_open in status.items():
+            buttons[name].config(bg="green" if is_open else "red")
+        self.valve_status.update(status)
+
+    def update_data(self):
+        # Drain every sample acquired since the last tick
+        samples = tel.get_samples()
+        self.ingest(samples)
+
+        if isinstance(tel, RemoteTelemetry) and tel.valve_status != self.valve_status:
+            # the daemon's sequencer or another client moved a valve
+            self.show_valves(tel.valve_status)
+
+        if samples:
+            # Warnings tripped on the acquisition thread (or the daemon's)
+            warning_messages = tel.warnings if isinstance(tel, RemoteTelemetry) else self.redlines.warnings()
+            self.warning_label.config(text="\n".join(warning_messages))
+
+        # Schedule the next update; drawing runs on self.render_scheduler
+        self.after_id = self.window.after(ACQUISITION_PERIOD_MS, self.update_data)
+
+    def ingest(self, samples):
+        # Samples to the recording, the store and the plot decimators
+        if self.recorder is not None:
+            self.recorder.extend(samples)  # to disk on the recorder thread
         #print('Got data')
-        if new_data and len(new_data) >= 6:
+        for sample_time, new_data in samples:
+            if not new_data or len(new_data) < 6:
+                continue
             #print('Good data')
             # Keep a full record
-            ts = time.time() - (self.test_start_time if hasattr(self, "test_Start_time") else self.start_time)
-            self.times.append(ts)
-            self.all_data.append(new_data[:6])
-
+            # one time base for the whole run: Start.  This used to pick between
+            # test_start_time and start_time through a misspelt hasattr, and
+            # switching bases mid-run is what left jumps like 0.00 -> -313.90 in
+            # old logs (legacy_log.repair_times fixes those)
+            ts = sample_time - self.start_time
             #print('Update data arrays')
-            self.pt1_data.append(new_data[0])
-            self.pt2_data.append(new_data[1])
-            self.pt3_data.append(new_data[2])
-            self.pt4_data.append(new_data[3])
-            self.pt5_data.append(new_data[4])
-            self.thrust_data.append(new_data[5])
-            
-             
+            self.store.append(ts, new_data[:6])
 
+            for channel, value in zip(CHANNELS, new_data):
+                if channel in self.plot_lines:   # the dashboard may show a subset
+                    self.decimators[self.plot_lines[channel]].append(ts, value)
+
+    def update_graphs(self):
+        # One frame from everything acquired so far, called at RENDER_FPS
+        if len(self.store):
             #print('Update plots')
-            self.pt1_line.set_data(range(len(self.pt1_data)), self.pt1_data)
-            self.pt1_ax.relim()
-            self.pt1_ax.autoscale_view()
-            self.pt1_canvas.draw()
-
-            self.pt2_line.set_data(range(len(self.pt2_data)), self.pt2_data)
-            self.pt2_ax.relim()
-            self.pt2_ax.autoscale_view()
-            self.pt2_canvas.draw()
-
-            self.pt3_line.set_data(range(len(self.pt3_data)), self.pt3_data)
-            self.pt3_ax.relim()
-            self.pt3_ax.autoscale_view()
-            self.pt3_canvas.draw()
-
-            self.pt4_line.set_data(range(len(self.pt4_data)), self.pt4_data)
-            self.pt4_ax.relim()
-            self.pt4_ax.autoscale_view()
-            self.pt4_canvas.draw()
+            window = VIEW_WINDOWS[self.view_window.get()]
+            if self.dashboard is not None:
+                self.dashboard.update({channel: self.plot_points(channel, window)
+                                       for channel in self.plot_lines})
+            elif BLIT:
+                for channel, line in self.plot_lines.items():
+                    self.renderers[line].update([self.plot_points(channel, window)])
+            else:
+                self.pt1_line.set_data(*self.plot_points("OPD_01", window))
+                self.pt1_ax.relim()
+                self.pt1_ax.autoscale_view()
+                self.pt1_canvas.draw()
+
+                self.pt2_line.set_data(*self.plot_points("OPD_02", window))
+                self.pt2_ax.relim()
+                self.pt2_ax.autoscale_view()
+                self.pt2_canvas.draw()
+
+                self.pt3_line.set_data(*self.plot_points("EPD_01", window))
+                self.pt3_ax.relim()
+                self.pt3_ax.autoscale_view()
+                self.pt3_canvas.draw()
+
+                self.pt4_line.set_data(*self.plot_points("FPD_01", window))
+                self.pt4_ax.relim()
+                self.pt4_ax.autoscale_view()
+                self.pt4_canvas.draw()
             
-            self.pt5_line.set_data(range(len(self.pt5_data)), self.pt5_data)
-            self.pt5_ax.relim()
-            self.pt5_ax.autoscale_view()
-            self.pt5_canvas.draw()
-
-            self.thrust_line.set_data(range(len(self.thrust_data)), self.thrust_data)
-            self.thrust_ax.relim()
-            self.thrust_ax.autoscale_view()
-            self.thrust_canvas.draw()
+                self.pt5_line.set_data(*self.plot_points("FPD_02", window))
+                self.pt5_ax.relim()
+                self.pt5_ax.autoscale_view()
+                self.pt5_canvas.draw()
+
+                self.thrust_line.set_data(*self.plot_points("THRUST", window))
+                self.thrust_ax.relim()
+                self.thrust_ax.autoscale_view()
+                self.thrust_canvas.draw()
             #print('Updated')
 
             # Update timer - use the test start time for accuracy
@@ -545,49 +822,47 @@ class GUI:
                 elapsed = time.time() - self.start_time
                 self.timer_label.config(text=f"Elapsed Time: {elapsed:.1f} s")
 
-            # Optional warnings
-            
-            warning_messages = []
-            if self.pt1_data and self.pt1_data[-1] > 350:  # Called "EPD_01" in original code
-                warning_messages.append("Almost too high EPD_01!")
-            if self.pt1_data and self.pt1_data[-1] < 150:
-                warning_messages.append("Almost too low EPD_01!")
-            if self.pt2_data and self.pt2_data[-1] > 530:
-                warning_messages.append("Almost too high FPD_01!")
-            if self.pt3_data and self.pt3_data[-1] > 825:
-                warning_messages.append("Almost too high OPD_01!")
-
-            self.warning_label.config(text="\n".join(warning_messages))
-            
-
-        # Schedule the next update
-        self.after_id = self.window.after(1000, self.update_graphs)
-
-    def save_data_to_csv(self):
+        sched = self.render_scheduler
+        self.render_label.config(text=f"{sched.fps:.0f} fps  {sched.render_time * 1000:.1f} ms/frame  "
+                                      f"{sched.dropped} dropped")
+
+    def plot_points(self, channel, window):
+        if window is None:
+            return self.decimators[self.plot_lines[channel]].points()
+        # most recent `window` seconds, full resolution up to PLOT_POINTS
+        start, stop = self.store.window(window)
+        return minmax_decimate(self.store.times[start:stop],
+                               self.store.column(channel)[start:stop], PLOT_POINTS // 2)
+
+    def save_run(self, path, export, channels, **run):
+        self.save_data_to_csv(export, channels)
+        if self.catalog is not None and path is not None:
+            # the summaries come from the run's samples, so the recording is not read back
+            run_id = self.catalog.add(path, channels, export=export, **run)
+            print(f"Catalogued {path} as run {run_id}")
+
+    def save_data_to_csv(self, csv_filename=None, channels=None):
+        # {sensor: (times, values)} of the run, by default what the store holds
+        if channels is None:
+            channels = {sensor: (self.store.times, self.store.column(sensor)) for sensor in CHANNELS}
         # Create a dictionary to collect time:value pairs for each sensor.
-        sensors = {"OPD_01": [], "OPD_02": [], "EPD_01": [], "FPD_01": [], "FPD_02": [], "THRUST": []}
-        i = 0 
-        for row in self.all_data:
-            # row[0] is the time offset; row[1] is PT1, row[2] is PT2, etc.
-            t = self.times[i]
-            sensors["OPD_01"].append(f"{t:.2f}:{row[0]}")
-            sensors["OPD_02"].append(f"{t:.2f}:{row[1]}")
-            sensors["EPD_01"].append(f"{t:.2f}:{row[2]}")
-            sensors["FPD_01"].append(f"{t:.2f}:{row[3]}")
-            sensors["FPD_02"].append(f"{t:.2f}:{row[4]}")
-            sensors["THRUST"].append(f"{t:.2f}:{row[5]}")
-            i+=1
+        sensors = {}
+        for sensor, (times, values) in channels.items():
+            sensors[sensor] = [f"{t:.2f}:{v}" for t, v in zip(times.tolist(), values.tolist())]
 
         # For each sensor, join the time:value pairs into one string.
         data = []
         for sensor, pairs in sensors.items():
             data.append([sensor, ", ".join(pairs)])
 
+        import pandas as pd
+
         # Create a DataFrame with two columns: one for the sensor and one for its data.
         df = pd.DataFrame(data, columns=["Sensor", "Time"])
 
-        # Save the DataFrame to a CSV file.
-        csv_filename = "test_data.csv"
+        # Save the DataFrame to a CSV file, named for the run instead of
+        # overwriting the last one
+        csv_filename = csv_filename or recording_path(when=self.start_time, suffix='.csv')
         df.to_csv(csv_filename, index=False)
         print(f"Data saved to {csv_filename}.")
 
@@ -595,9 +870,16 @@ class GUI:
 if __name__ == "__main__":
     sys_health = System_Health()
     SIMULATION = False  # Set to False to use real telemetry
+    # socket path or host:port of a running daemon.py; the stand then keeps
+    # sampling and sequencing even if this window stalls or is closed
+    DAEMON = os.environ.get("BLP_DAEMON")
     if SIMULATION:
         tel = FakeTelemetry(sys_health)
+    elif DAEMON:
+        tel = RemoteTelemetry(parse_address(DAEMON))
     else:
+        # USB serial by default; for another link pass e.g.
+        # link=transport.Link(transport.TcpTransport(host, port)).start()
         tel = Telemetry(sys_health)
     window = GUI()
     window.window.mainloop()
@@ -0,0 +1,96 @@
+'''
+Streaming acquisition: a thread that owns the link and polls it as fast as
+it answers, pushing timestamped samples into a bounded ring buffer that the
+GUI drains on its own schedule.
+'''
+
+import threading
+import time
+
+
+class RingBuffer:
+    '''
+    Bounded single-producer / single-consumer ring buffer.
+
+    The producer only ever advances `head` and the consumer only `tail`, and
+    both are plain int rebinds, so no lock is needed under the GIL.  When the
+    consumer falls more than `capacity` behind, the oldest samples are
+    overwritten and counted in `dropped`.
+    '''
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0   # total items ever pushed
+        self.tail = 0   # total items ever consumed
+        self.dropped = 0
+
+    def __len__(self):
+        return min(self.head - self.tail, self.capacity)
+
+    def push(self, item):
+        self.slots[self.head % self.capacity] = item
+        self.head += 1
+
+    def latest(self):
+        head = self.head
+        if head == 0:
+            return None
+        return self.slots[(head - 1) % self.capacity]
+
+    def drain(self):
+        '''Return every item pushed since the last drain, oldest first.'''
+        head = self.head
+        start = max(self.tail, head - self.capacity)
+        items = [self.slots[i % self.capacity] for i in range(start, head)]
+        # anything the producer lapped while we were copying is stale
+        overrun = self.head - self.capacity - start
+        if overrun > 0:
+            items = items[overrun:]
+            start += overrun
+        self.dropped += start - self.tail
+        self.tail = head
+        return items
+
+
+class Acquisition(threading.Thread):
+    '''
+    Calls `read()` in a loop and pushes (time.time(), values) samples into
+    `self.buffer`.  `period` throttles the loop; 0 samples at link rate.
+    on_sample(t, values), if given, sees every sample on this thread as it
+    arrives, e.g. redline.Redlines.check_sample.
+    '''
+
+    def __init__(self, read, capacity=4096, period=0.0, on_sample=None):
+        super().__init__(name="acquisition", daemon=True)
+        self.read = read
+        self.period = period
+        self.on_sample = on_sample
+        self.buffer = RingBuffer(capacity)
+        self.errors = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                values = self.read()
+            except Exception as e:
+                self.errors += 1
+                print(f"Acquisition read failed: {e}")
+                self._stop_event.wait(0.1)
+                continue
+            t = time.time()
+            self.buffer.push((t, values))
+            if self.on_sample is not None:
+                try:
+                    self.on_sample(t, values)
+                except Exception as e:
+                    print(f"Sample hook failed: {e}")
+            if self.period:
+                self._stop_event.wait(self.period)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        # on_sample may stop acquisition (a redline abort) from this thread
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout)
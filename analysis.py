@@ -0,0 +1,297 @@
+'''
+Post-test performance analysis of recorded runs.
+
+Each run is reduced to engine numbers with whole-array numpy operations:
+the burn (thrust above a fraction of its peak, short dropouts bridged),
+total impulse and average/peak thrust over it, chamber pressure
+statistics, how far each feed pressure sagged from just before ignition,
+and Isp when the propellant mass or mass flows are given.  A campaign is
+spread over a process pool, one run per task, and comes back as one table.
+
+    python analysis.py runs/ 2.13.26.txt                 # every log in runs/ and one more
+    python analysis.py runs/*.blprec --propellant-mass 1.8 --csv campaign.csv
+    python analysis.py hotfire.blplog --ox-flow 0.42 --fuel-flow 0.19
+
+Runs may be legacy "t:v" CSV logs (their bogus timestamps are repaired
+first), recorder .blprec recordings, .blplog binary logs or .blpz
+compressed logs.  Thrust is in lbf and mass in lbm, so Isp = impulse /
+propellant mass comes out in seconds.
+'''
+
+import argparse
+import csv
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+THRUST = 'THRUST'
+CHAMBER = 'EPD_01'
+FEEDS = ('OPD_01', 'OPD_02', 'FPD_01', 'FPD_02')
+
+# a run peaking below this many lbf (after the tare) never fired
+MIN_THRUST = 10.0
+
+# the burn is where thrust is above this fraction of its peak
+BURN_FRACTION = 0.1
+
+# dips below the burn threshold shorter than this (s) stay part of the burn
+BRIDGE = 0.1
+
+# seconds before ignition averaged for the thrust tare and feed pressures
+PRE_BURN = 1.0
+
+LOG_SUFFIXES = ('.txt', '.csv', '.blprec', '.blplog', '.blpz')
+
+# summary table columns: (key, heading, format)
+FIELDS = (
+    ('run', 'run', '{}'),
+    ('samples', 'samples', '{:d}'),
+    ('time_fixes', 'time fixes', '{:d}'),
+    ('burn_start', 'start s', '{:.2f}'),
+    ('burn_time', 'burn s', '{:.2f}'),
+    ('impulse', 'impulse lbf*s', '{:.1f}'),
+    ('avg_thrust', 'avg lbf', '{:.1f}'),
+    ('peak_thrust', 'peak lbf', '{:.1f}'),
+    ('chamber_mean', 'Pc mean', '{:.1f}'),
+    ('chamber_max', 'Pc max', '{:.1f}'),
+    ('chamber_roughness', 'Pc rough %', '{:.2f}'),
+) + tuple((f'{name}_drop', f'{name} drop', '{:.1f}') for name in FEEDS) + (
+    ('isp', 'Isp s', '{:.1f}'),
+    ('error', 'error', '{}'),
+)
+
+
+def load_run(path):
+    '''
+    ({channel: (times, values)}, {"start_time", "time_fixes"}) for any log
+    format.  Times are from the run start; start_time is the wall clock
+    time of it where the format keeps one, and time_fixes counts the
+    timestamp jumps repaired in a legacy log.
+    '''
+    if path.endswith('.blplog'):
+        from binlog import BinaryLog
+        with BinaryLog(path) as log:
+            return ({name: (np.array(log.times(name)), np.array(log.values(name)))
+                     for name in log.channels}, {'start_time': log.start_time, 'time_fixes': 0})
+    if path.endswith('.blpz'):
+        from channel_codec import read_compressed
+        header, channels = read_compressed(path)
+        fixes = 0
+        if header.get('legacy_times'):
+            # archived as written; repair like the legacy log itself
+            from legacy_log import repair_log
+            channels, report = repair_log(channels)
+            fixes = max((len(f) for f, _ in report.values()), default=0)
+        return channels, {'start_time': header['start_time'], 'time_fixes': fixes}
+    if path.endswith('.blprec'):
+        from recorder import read_recording
+        rec = read_recording(path)
+        times = rec.times - rec.start_time
+        return ({name: (times, rec.values[:, i]) for i, name in enumerate(rec.channels)},
+                {'start_time': rec.start_time, 'time_fixes': 0})
+    from legacy_log import load_legacy_log, repair_log
+    channels, report = repair_log(load_legacy_log(path))
+    return channels, {'start_time': None,
+                      'time_fixes': max((len(fixes) for fixes, _ in report.values()), default=0)}
+
+
+def _finite(times, values):
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    keep = np.isfinite(times) & np.isfinite(values)
+    if not keep.all():
+        times, values = times[keep], values[keep]   # link gaps
+    if len(times) > 1 and np.any(np.diff(times) < 0):
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+    return times, values
+
+
+def _between(times, values, start, stop):
+    i, j = np.searchsorted(times, (start, stop), side='left')
+    return values[i:j]
+
+
+def _integrate(times, values):
+    '''Trapezoidal integral of values over times.'''
+    if len(times) < 2:
+        return 0.0
+    return float(np.sum(np.diff(times) * (values[1:] + values[:-1])) / 2)
+
+
+def detect_burn(times, thrust, min_thrust=MIN_THRUST, fraction=BURN_FRACTION,
+                bridge=BRIDGE, pre_burn=PRE_BURN):
+    '''
+    (first index, last index, tare) of the burn in sorted times/thrust, or
+    None if the tared thrust never reaches min_thrust.  The tare is the
+    median thrust before the burn (the load cell's zero); the burn is the
+    stretch above fraction of the peak that holds the peak, with dips
+    shorter than bridge seconds closed.
+    '''
+    if len(thrust) < 2:
+        return None
+    # a first tare from the opening pre_burn seconds finds the peak, the
+    # final one is taken right before the burn
+    tare = float(np.median(thrust[:max(int(np.searchsorted(times, times[0] + pre_burn)), 1)]))
+    net = thrust - tare
+    peak = int(np.argmax(net))
+    if net[peak] < min_thrust:
+        return None
+    on = np.concatenate(([0], (net > fraction * net[peak]).astype(np.int8), [0]))
+    edges = np.diff(on)
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1) - 1
+    keep = times[starts[1:]] - times[stops[:-1]] > bridge
+    starts = starts[np.concatenate(([True], keep))]
+    stops = stops[np.concatenate((keep, [True]))]
+    k = int(np.searchsorted(starts, peak, side='right')) - 1
+    first, last = int(starts[k]), int(stops[k])
+    before = thrust[int(np.searchsorted(times, times[first] - pre_burn)):first]
+    if len(before):
+        tare = float(np.median(before))
+    return first, last, tare
+
+
+def analyze_channels(channels, propellant_mass=None, ox_flow=None, fuel_flow=None, **burn_options):
+    '''
+    Engine numbers for one run's {channel: (times, values)}, as a dict
+    keyed like FIELDS.  Burn dependent entries are None when the run did not
+    fire (a cold flow) or lacks the channel.  Isp uses propellant_mass
+    (lbm), or ox_flow + fuel_flow (lbm/s) over the burn time.
+    '''
+    series = {name: _finite(t, v) for name, (t, v) in channels.items()}
+    result = {key: None for key, _, _ in FIELDS}
+    result['samples'] = max((len(t) for t, _ in series.values()), default=0)
+    if THRUST not in series:
+        result['error'] = f"no {THRUST} channel"
+        return result
+
+    times, thrust = series[THRUST]
+    burn = detect_burn(times, thrust, **burn_options)
+    if burn is None:
+        if len(thrust):
+            result['peak_thrust'] = float(np.max(thrust - np.median(thrust)))
+        return result
+    first, last, tare = burn
+    start, stop = float(times[first]), float(times[last])
+    net = thrust[first:last + 1] - tare
+    impulse = _integrate(times[first:last + 1], net)
+    duration = stop - start
+    result.update(burn_start=start, burn_time=duration, impulse=impulse,
+                  avg_thrust=impulse / duration if duration > 0 else None,
+                  peak_thrust=float(net.max()))
+
+    if CHAMBER in series:
+        pc = _between(*series[CHAMBER], start, stop)
+        if len(pc):
+            mean = float(pc.mean())
+            result.update(chamber_mean=mean, chamber_max=float(pc.max()),
+                          chamber_roughness=100 * float(pc.std()) / mean if mean > 0 else None)
+
+    pre_burn = burn_options.get('pre_burn', PRE_BURN)
+    for name in FEEDS:
+        if name in series:
+            before = _between(*series[name], start - pre_burn, start)
+            during = _between(*series[name], start, stop)
+            if len(before) and len(during):
+                result[f'{name}_drop'] = float(before.mean() - during.mean())
+
+    mass = propellant_mass
+    if mass is None and ox_flow is not None and fuel_flow is not None:
+        mass = (ox_flow + fuel_flow) * duration
+    if mass:
+        result['isp'] = impulse / mass
+    return result
+
+
+def analyze_file(path, **options):
+    '''analyze_channels() of one log; a run that cannot be read comes back with its error.'''
+    try:
+        channels, meta = load_run(path)
+        result = analyze_channels(channels, **options)
+        result['time_fixes'] = meta['time_fixes']
+    except (OSError, ValueError, KeyError, struct.error, zlib.error) as e:
+        # truncated or corrupt files fail in the decoders with their own errors
+        result = {key: None for key, _, _ in FIELDS}
+        result['error'] = (str(e) if isinstance(e, (OSError, ValueError))
+                           else f"corrupt log ({e})")
+    result['run'] = os.path.basename(path)
+    return result
+
+
+def analyze_campaign(paths, workers=None, **options):
+    '''analyze_file() of every path on a process pool, results in path order.'''
+    paths = list(paths)
+    if len(paths) < 2 or workers == 1:
+        return [analyze_file(path, **options) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_file, path, **options) for path in paths]
+        return [future.result() for future in futures]
+
+
+def find_logs(sources):
+    '''The given files, and the logs directly inside the given directories, sorted.'''
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(os.path.join(source, name) for name in os.listdir(source)
+                                if name.endswith(LOG_SUFFIXES)))
+        else:
+            paths.append(source)
+    return paths
+
+
+def format_table(results):
+    '''Results as an aligned text table, leaving out columns no run has.'''
+    fields = [f for f in FIELDS if any(r.get(f[0]) not in (None, '') for r in results)]
+    rows = [[f[1] for f in fields]]
+    for r in results:
+        rows.append(['-' if r.get(key) is None else fmt.format(r[key]) for key, _, fmt in fields])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(fields))]
+    return "\n".join("  ".join(cell.ljust(w) if i == 0 else cell.rjust(w)
+                               for i, (cell, w) in enumerate(zip(row, widths))).rstrip()
+                     for row in rows)
+
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([key for key, _, _ in FIELDS])
+        for r in results:
+            writer.writerow(['' if r.get(key) is None else r[key] for key, _, _ in FIELDS])
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', nargs='+', help="log files, or directories of them")
+    parser.add_argument('--propellant-mass', type=float, help="propellant burned per run (lbm)")
+    parser.add_argument('--ox-flow', type=float, help="oxidizer mass flow (lbm/s)")
+    parser.add_argument('--fuel-flow', type=float, help="fuel mass flow (lbm/s)")
+    parser.add_argument('--min-thrust', type=float, default=MIN_THRUST,
+                        help="tared thrust a run must reach to count as a burn (lbf)")
+    parser.add_argument('--workers', type=int, help="processes (default: one per CPU)")
+    parser.add_argument('--csv', help="also write the table here")
+    args = parser.parse_args()
+    if (args.ox_flow is None) != (args.fuel_flow is None):
+        parser.error("--ox-flow and --fuel-flow go together")
+
+    paths = find_logs(args.sources)
+    started = time.perf_counter()
+    results = analyze_campaign(paths, args.workers, propellant_mass=args.propellant_mass,
+                               ox_flow=args.ox_flow, fuel_flow=args.fuel_flow,
+                               min_thrust=args.min_thrust)
+    elapsed = time.perf_counter() - started
+    print(format_table(results))
+    print(f"{len(results)} runs in {elapsed:.2f} s")
+    if args.csv:
+        print(f"wrote {write_csv(results, args.csv)}")
+
+
+if __name__ == '__main__':
+    main()
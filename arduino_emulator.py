@@ -0,0 +1,158 @@
+'''
+Arduino stand-in on a Linux pseudo-terminal.
+
+Speaks the same protocol as the test stand firmware so UART.py and
+pycode.Telemetry run unmodified against it:
+- per-channel polls '5' '6' '7' '8' 'A' '&', one ASCII float line each
+- BULK_POLL, one telemetry frame (frames.py)
+- legacy "[" slot "," command bytes
+- framed commands, answered with an ack frame
+
+    emu = ArduinoEmulator(baud_rate=115200, response_delay=0.002, noise=1.0)
+    emu.start()
+    # open emu.port with pyserial ...
+    emu.stop()
+'''
+
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+import frames
+
+# poll byte -> channel index, in receive_response() order
+POLLS = {ord('5'): 0, ord('6'): 1, ord('7'): 2, ord('8'): 3, ord('A'): 4, ord('&'): 5}
+
+# resting value and swing of each channel: OPD_01 OPD_02 EPD_01 FPD_01 FPD_02 THRUST
+LEVELS = ((20.0, 5.0), (700.0, 80.0), (300.0, 150.0), (50.0, 40.0), (55.0, 5.0), (2.0, 2.0))
+
+PACKET_SLOTS = 8
+
+
+class EmulatedDevice:
+    '''
+    The firmware's protocol state machine without any I/O: feed() takes the
+    bytes the host wrote and returns the replies to send back.  Shared by
+    the pty emulator and transport.LoopbackTransport.
+    '''
+
+    def __init__(self, baud_rate=9600, response_delay=0.0, noise=0.0,
+                 bulk=True, framed=True, seed=None, clock=time.monotonic):
+        self.baud_rate = baud_rate
+        self.response_delay = response_delay
+        self.noise = noise
+        self.bulk = bulk
+        self.framed = framed
+        self.random = random.Random(seed)
+        self.clock = clock   # simulation.VirtualClock for simulated runs
+
+        self.seq = 0
+        self.start_time = self.clock()
+        # (clock time, raw command bytes) for every command received
+        self.commands = []
+        self._slots = []
+        self._buf = bytearray()
+
+    def values(self):
+        t = self.clock() - self.start_time
+        out = []
+        for i, (level, swing) in enumerate(LEVELS):
+            v = level + swing * math.sin(t * 0.5 + i)
+            if self.noise:
+                v += self.random.gauss(0.0, self.noise)
+            out.append(round(v, 2))
+        return out
+
+    def reply_delay(self, data):
+        # response latency plus the time the bytes take at the configured baud (8N1)
+        return self.response_delay + len(data) * 10 / self.baud_rate
+
+    def feed(self, data):
+        self._buf += data
+        replies = []
+        buf = self._buf
+        while buf:
+            head = buf[0]
+            if self._slots or head == ord('['):
+                # legacy command slot: "[" str(slot) ","
+                end = buf.find(b',')
+                if end < 0:
+                    break
+                self._slots.append(bytes(buf[:end + 1]))
+                del buf[:end + 1]
+                if len(self._slots) == PACKET_SLOTS:
+                    self.commands.append((self.clock(), b''.join(self._slots)))
+                    self._slots = []
+            elif head == frames.COMMAND_SYNC[0] and self.framed:
+                if len(buf) < 5:
+                    break
+                size = 5 + buf[4] + 2
+                if len(buf) < size:
+                    break
+                frame = bytes(buf[:size])
+                del buf[:size]
+                try:
+                    seq, payload = frames.decode_command(frame)
+                except frames.FrameError:
+                    continue
+                if payload:   # an empty one is the host's capability probe
+                    self.commands.append((self.clock(), payload))
+                replies.append(frames.encode_ack(seq))
+            elif head == frames.BULK_POLL[0] and self.bulk:
+                del buf[:1]
+                self.seq += 1
+                device_ms = int((self.clock() - self.start_time) * 1000)
+                replies.append(frames.encode_telemetry(self.seq, device_ms, self.values()))
+            elif head in POLLS:
+                del buf[:1]
+                replies.append(f"{self.values()[POLLS[head]]:.2f}\r\n".encode())
+            else:
+                # unknown byte: old firmware ignores it too
+                del buf[:1]
+        return replies
+
+
+class ArduinoEmulator(threading.Thread):
+    '''Serves an EmulatedDevice on a pty; options are passed through to it.'''
+
+    def __init__(self, **options):
+        super().__init__(name="arduino-emulator", daemon=True)
+        self.device = EmulatedDevice(**options)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self._stop_event = threading.Event()
+
+    @property
+    def commands(self):
+        return self.device.commands
+
+    def run(self):
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            for reply in self.device.feed(data):
+                delay = self.device.reply_delay(reply)
+                if delay:
+                    time.sleep(delay)
+                os.write(self.master, reply)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,165 @@
+'''
+Hot-path benchmarks for the real UART.py / pycode.Telemetry stack, run
+against arduino_emulator on a pty so no test stand is needed.
+
+    python benchmark.py --baud 115200 --delay 0.001 --noise 1
+    python benchmark.py --legacy          # old per-channel / per-byte firmware
+    python benchmark.py --imports         # import-time budget, exit 1 if over
+
+Reports polled and streamed samples/s, poll latency and jitter, and command
+wire / ack latency percentiles.
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from arduino_emulator import ArduinoEmulator
+
+
+def _line(name, s):
+    if not s['count']:
+        return f"{name:<16} no samples"
+    return (f"{name:<16} n={s['count']:<5} mean={s['mean']:8.3f} p50={s['p50']:8.3f} "
+            f"p95={s['p95']:8.3f} p99={s['p99']:8.3f} max={s['max']:8.3f} ms")
+
+
+def run(polls=200, commands=20, stream_seconds=2.0, baud_rate=115200,
+        response_delay=0.0, noise=0.0, legacy=False):
+    emu = ArduinoEmulator(baud_rate=baud_rate, response_delay=response_delay,
+                          noise=noise, bulk=not legacy, framed=not legacy, seed=0)
+    emu.start()
+    os.environ['BLP_SERIAL_PORT'] = emu.port
+    # imported here so UART opens the emulator's pty instead of /dev/ttyACM0
+    import pycode
+
+    tel = pycode.Telemetry(pycode.System_Health)
+    metrics = pycode.Metrics(size=max(polls, commands, 1))
+    results = {}
+    try:
+        # first poll / command also detects which protocol the firmware speaks
+        tel.get_data()
+        tel.send_data()
+        tel.metrics = pycode.Metrics(size=max(commands, 1))
+
+        intervals = []
+        last = None
+        begin = time.perf_counter()
+        for _ in range(polls):
+            start = time.perf_counter()
+            tel.get_data()
+            metrics.record('poll', time.perf_counter() - start)
+            if last is not None:
+                intervals.append(start - last)
+            last = start
+        elapsed = time.perf_counter() - begin
+        results['polled samples/s'] = polls / elapsed if elapsed else 0.0
+        if intervals:
+            mean = sum(intervals) / len(intervals)
+            for dt in intervals:
+                metrics.record('poll jitter', abs(dt - mean))
+
+        for i in range(commands):
+            if i % 2:
+                tel.close_valve(pycode.V1)
+            else:
+                tel.open_valve(pycode.V1)
+            tel.send_data()
+
+        if stream_seconds:
+            tel.start_stream()
+            time.sleep(stream_seconds)
+            samples = tel.get_samples()
+            tel.stop_stream()
+            results['streamed samples/s'] = len(samples) / stream_seconds
+
+        for name in ('poll', 'poll jitter'):
+            results[name] = metrics.summary(name)
+        for name in ('command wire', 'command ack'):
+            results[name] = tel.metrics.summary(name)
+    finally:
+        tel.stop_stream()
+        emu.stop()
+    return results
+
+
+# Import budget on the Pi, in seconds, and modules that import must not pull
+# in.  Importing may not open the serial port either (UART.link stays None).
+IMPORT_BUDGET = {
+    'UART': (0.25, ('numpy', 'pandas', 'matplotlib')),
+    'pycode': (0.5, ('numpy', 'pandas', 'matplotlib')),
+    'Updated_GUI': (1.0, ('pandas', 'matplotlib')),
+}
+
+_IMPORT_PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {name}
+elapsed = time.perf_counter() - start
+uart = sys.modules.get('UART')
+print(elapsed)
+print(' '.join(m for m in {forbidden!r} if m in sys.modules))
+print(int(uart is not None and uart.link is not None))
+'''
+
+
+def import_times(budget=IMPORT_BUDGET):
+    '''
+    Import each module in a fresh interpreter.  Returns {module: (seconds,
+    problems)}; problems lists anything over budget or loaded that should not be.
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, (limit, forbidden) in budget.items():
+        probe = _IMPORT_PROBE.format(name=name, forbidden=forbidden)
+        out = subprocess.run([sys.executable, '-c', probe], cwd=here, capture_output=True,
+                             text=True, check=True).stdout.splitlines()
+        elapsed, loaded, port_open = float(out[-3]), out[-2].split(), out[-1] == '1'
+        problems = [f"imports {m}" for m in loaded]
+        if elapsed > limit:
+            problems.append(f"over {limit:.2f} s budget")
+        if port_open:
+            problems.append("opens the serial port")
+        results[name] = (elapsed, problems)
+    return results
+
+
+def report(results):
+    lines = []
+    for name, value in results.items():
+        if isinstance(value, dict):
+            lines.append(_line(name, value))
+        else:
+            lines.append(f"{name:<16} {value:10.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--polls', type=int, default=200)
+    parser.add_argument('--commands', type=int, default=20)
+    parser.add_argument('--stream', type=float, default=2.0, help="seconds of streamed acquisition")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--delay', type=float, default=0.0, help="device response delay (s)")
+    parser.add_argument('--noise', type=float, default=0.0, help="std dev of sensor noise")
+    parser.add_argument('--legacy', action='store_true', help="emulate firmware without bulk/framed support")
+    parser.add_argument('--output', help="also write the report to this file")
+    parser.add_argument('--imports', action='store_true', help="check the import-time budget instead")
+    args = parser.parse_args()
+
+    if args.imports:
+        failed = False
+        for name, (elapsed, problems) in import_times().items():
+            failed = failed or bool(problems)
+            print(f"{name:<16} {elapsed * 1000:8.1f} ms  {'; '.join(problems) or 'ok'}")
+        sys.exit(1 if failed else 0)
+
+    text = report(run(args.polls, args.commands, args.stream, args.baud,
+                      args.delay, args.noise, args.legacy))
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
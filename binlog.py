@@ -0,0 +1,218 @@
+'''
+Columnar binary test logs (.blplog), opened with mmap.
+
+Every channel is a contiguous little-endian float64 array, values and
+times apiece (channels sampled together share one time array), laid out
+after a JSON header that names each array and its byte offset.  Opening a
+log maps the file and reads only the header; slicing a time window of one
+channel binary-searches that channel's times and touches just the pages
+of the window, however big the file or however many channels it holds.
+
+    python binlog.py convert 2.13.26.txt runs/run_*.blprec   # -> .blplog beside each
+    python binlog.py info 2.13.26.blplog
+    python binlog.py slice 2.13.26.blplog OPD_02 10 12
+
+File layout:
+    MAGIC, header length (I), JSON header, padding, arrays
+Each array starts on an ALIGN-byte boundary.  The header holds
+{"version", "start_time", "source", "notes", "arrays": {name: {"offset",
+"length"}}, "channels": [{"name", "unit", "time", "values", "sorted"}]},
+where "time" and "values" name arrays and "sorted" says the times never go
+backwards.
+'''
+
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from legacy_log import format_repairs, load_legacy_log, repair_log
+from recorder import read_recording
+
+MAGIC = b'BLPLOG1\n'
+_LENGTH = struct.Struct('<I')
+ALIGN = 64
+VERSION = 1
+DTYPE = '<f8'
+
+UNITS = {'OPD_01': 'psi', 'OPD_02': 'psi', 'EPD_01': 'psi',
+         'FPD_01': 'psi', 'FPD_02': 'psi', 'THRUST': 'lbf'}
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def write_log(path, channels, start_time=None, source=None, notes=None):
+    '''
+    Write {channel: (times, values)} to `path`.  Channels whose times are
+    identical store them once.  notes is free text kept in the header, e.g.
+    what a conversion repaired.
+    '''
+    arrays = []        # (name, float64 array), in file order
+    entries = []
+    for name, (times, values) in channels.items():
+        times = np.ascontiguousarray(times, dtype=DTYPE)
+        values = np.ascontiguousarray(values, dtype=DTYPE)
+        if len(times) != len(values):
+            raise ValueError(f"{name}: {len(times)} times but {len(values)} values")
+        shared = next((n for n, a in arrays if n.startswith('time') and np.array_equal(a, times)), None)
+        if shared is None:
+            shared = f'time{sum(n.startswith("time") for n, _ in arrays)}'
+            arrays.append((shared, times))
+        arrays.append((name, values))
+        entries.append({'name': name, 'unit': UNITS.get(name, ''), 'time': shared, 'values': name,
+                        'sorted': bool(np.all(np.diff(times) >= 0))})
+
+    header = {'version': VERSION, 'start_time': start_time, 'source': source, 'notes': notes,
+              'arrays': {}, 'channels': entries}
+    # the offsets are part of the header they follow: grow the space until it fits
+    layout = 0
+    while True:
+        offset = layout
+        for name, array in arrays:
+            header['arrays'][name] = {'offset': offset, 'length': len(array)}
+            offset = _aligned(offset + array.nbytes)
+        text = json.dumps(header).encode()
+        needed = _aligned(len(MAGIC) + _LENGTH.size + len(text))
+        if needed <= layout:
+            break
+        layout = needed
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC + _LENGTH.pack(len(text)) + text)
+        for name, array in arrays:
+            f.seek(header['arrays'][name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    return path
+
+
+class BinaryLog:
+    '''
+    A .blplog opened read-only with mmap.  Arrays are zero-copy views of the
+    mapping; nothing is read until it is touched.  The mapping stays open
+    as long as the log or any array taken from it is alive.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        if self._map[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"{path}: not a binary log")
+        length, = _LENGTH.unpack_from(self._map, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        self.header = json.loads(self._map[start:start + length].tobytes().decode())
+        if self.header['version'] != VERSION:
+            raise ValueError(f"{path}: version {self.header['version']}, expected {VERSION}")
+        self.start_time = self.header['start_time']
+        self.channel_info = {c['name']: c for c in self.header['channels']}
+        self.channels = tuple(self.channel_info)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # arrays already handed out keep their pages mapped
+        self._map = None
+
+    def _array(self, name):
+        info = self.header['arrays'][name]
+        start = info['offset']
+        return self._map[start:start + 8 * info['length']].view(DTYPE)
+
+    def times(self, channel):
+        return self._array(self.channel_info[channel]['time'])
+
+    def values(self, channel):
+        return self._array(self.channel_info[channel]['values'])
+
+    def window(self, channel, start, stop):
+        '''(times, values) views of `channel` with start <= t < stop.'''
+        times, values = self.times(channel), self.values(channel)
+        if self.channel_info[channel]['sorted']:
+            i, j = np.searchsorted(times, (start, stop))
+            return times[i:j], values[i:j]
+        # unrepaired legacy times: no shortcut, scan them
+        keep = (times >= start) & (times < stop)
+        return times[keep], values[keep]
+
+
+def convert_channels(src, repair=True):
+    '''
+    ({channel: (times, values)}, header fields) from a legacy "t:v" CSV
+    log or a recorder .blprec recording.  A legacy log's bogus timestamps
+    are repaired (legacy_log.repair_times) unless repair is False; what was
+    changed is printed and returned in the notes.
+    '''
+    source = os.path.basename(src)
+    if src.endswith('.blprec'):
+        rec = read_recording(src)
+        times = rec.times - rec.start_time
+        channels = {name: (times, rec.values[:, i]) for i, name in enumerate(rec.channels)}
+        return channels, {'start_time': rec.start_time, 'source': source, 'notes': None}
+    channels = load_legacy_log(src)
+    notes = None
+    if repair:
+        channels, report = repair_log(channels)
+        notes = format_repairs(report) or None
+        if notes:
+            print(f"{src}: {notes}")
+    return channels, {'start_time': None, 'source': source, 'notes': notes}
+
+
+def convert(src, dst=None, repair=True):
+    '''
+    Convert a legacy log or a recording (see convert_channels) to a
+    .blplog; dst defaults to src with the .blplog extension.
+    '''
+    dst = dst or os.path.splitext(src)[0] + '.blplog'
+    channels, meta = convert_channels(src, repair)
+    return write_log(dst, channels, **meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('convert', help="legacy CSV logs or .blprec recordings to .blplog")
+    p.add_argument('sources', nargs='+')
+    p.add_argument('--no-repair', action='store_true',
+                   help="keep legacy timestamps as written, jumps and all")
+    p = commands.add_parser('info', help="channels and sizes")
+    p.add_argument('log')
+    p = commands.add_parser('slice', help="print one channel between two times")
+    p.add_argument('log')
+    p.add_argument('channel')
+    p.add_argument('start', type=float)
+    p.add_argument('stop', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        for src in args.sources:
+            dst = convert(src, repair=not args.no_repair)
+            print(f"{src} ({os.path.getsize(src)} bytes) -> {dst} ({os.path.getsize(dst)} bytes)")
+    elif args.command == 'info':
+        with BinaryLog(args.log) as log:
+            print(f"{args.log}: source {log.header['source']}, start time {log.start_time}")
+            if log.header.get('notes'):
+                print(f"  {log.header['notes']}")
+            for name in log.channels:
+                times = log.times(name)
+                span = f"{times[0]:.3f} .. {times[-1]:.3f} s" if len(times) else "empty"
+                info = log.channel_info[name]
+                print(f"  {name:<8} {info['unit']:<4} {len(times):>8} samples  {span}"
+                      f"{'' if info['sorted'] else '  (times out of order)'}")
+    else:
+        with BinaryLog(args.log) as log:
+            for t, v in zip(*log.window(args.channel, args.start, args.stop)):
+                print(f"{t:.4f},{v}")
+
+
+if __name__ == '__main__':
+    main()
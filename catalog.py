@@ -0,0 +1,257 @@
+'''
+Run catalog: an SQLite index of every test run.
+
+Each run gets one row of metadata (where its data is, the wall clock start,
+duration, channels, which sequence ran, why it was aborted) and one row of
+min/max/mean per channel.  The GUI and the daemon add their recording when
+a run ends; older logs are added by hand.  Cross-run questions are then
+answered from the index alone, without opening a data file:
+
+    python catalog.py add 2.13.26.txt 2.13.26.2.txt --abort "cold flow"
+    python catalog.py list
+    python catalog.py query "FPD_01 > 500"                # runs where FPD_01 exceeded 500
+    python catalog.py query "EPD_01.mean >= 400" "OPD_02 < 400" --aborted
+
+A condition is "CHANNEL[.STAT] OP NUMBER" with OP one of < <= > >= and STAT
+min, max or mean; without a STAT, > and >= test the channel's max (it went
+above) and < and <= its min (it went below).  Conditions must all hold.
+
+The sequence is identified by a hash of its (time, function) steps rather
+than the file bytes, so the GUI, the daemon and a remote client all hash a
+sequence the same way however it reached the stand.
+'''
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from recorder import RECORD_DIR
+
+CATALOG_PATH = os.path.join(RECORD_DIR, 'catalog.sqlite')
+
+STATS = ('min', 'max', 'mean')
+_CONDITION = re.compile(r'^\s*(\w+)(?:\.(\w+))?\s*(<=|>=|<|>)\s*(\S+)\s*$')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    export TEXT,
+    start_time REAL,
+    duration REAL,
+    samples INTEGER,
+    channels TEXT,
+    sequence TEXT,
+    sequence_hash TEXT,
+    abort_reason TEXT,
+    added REAL
+);
+CREATE TABLE IF NOT EXISTS channel_stats (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    channel TEXT NOT NULL,
+    samples INTEGER,
+    min REAL,
+    max REAL,
+    mean REAL,
+    PRIMARY KEY (run_id, channel)
+);
+CREATE INDEX IF NOT EXISTS channel_max ON channel_stats (channel, max);
+CREATE INDEX IF NOT EXISTS channel_min ON channel_stats (channel, min);
+CREATE INDEX IF NOT EXISTS runs_start ON runs (start_time);
+'''
+
+
+def sequence_hash(steps):
+    '''sha256 of a sequence's (time, function) steps, as load_sequence() returns them.'''
+    canonical = json.dumps([[float(t), str(function)] for t, function in steps])
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def channel_stats(channels):
+    '''{channel: (samples, min, max, mean)} over the finite values of {channel: (times, values)}.'''
+    stats = {}
+    for name, (_, values) in channels.items():
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values):
+            stats[name] = (len(values), float(values.min()), float(values.max()), float(values.mean()))
+        else:
+            stats[name] = (0, None, None, None)
+    return stats
+
+
+def parse_condition(text):
+    '''(channel, stat, operator, number) of a "CHANNEL[.STAT] OP NUMBER" condition.'''
+    match = _CONDITION.match(text)
+    if not match:
+        raise ValueError(f"bad condition {text!r}, expected e.g. 'FPD_01 > 500' or 'EPD_01.mean >= 400'")
+    channel, stat, op, number = match.groups()
+    if stat is None:
+        stat = 'max' if op.startswith('>') else 'min'
+    if stat not in STATS:
+        raise ValueError(f"{text!r}: stat must be one of {', '.join(STATS)}")
+    try:
+        number = float(number)
+    except ValueError:
+        raise ValueError(f"{text!r}: {number!r} is not a number") from None
+    return channel, stat, op, number
+
+
+class Catalog:
+    '''
+    The index at `path`.  Every call opens its own connection, so one
+    Catalog may be used from the GUI's export thread and the daemon's
+    client threads alike.
+    '''
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        '''A connection that commits on success and is always closed.'''
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA foreign_keys = ON')
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, path, channels, start_time=None, export=None, sequence=None,
+            steps=None, abort_reason=None):
+        '''
+        Index one run held in `path` from its {channel: (times, values)},
+        times from the run start.  sequence names the sequence file and
+        steps are its (time, function) pairs, hashed.  A run already in the
+        catalog under the same path is replaced.  Returns its id.
+        '''
+        stats = channel_stats(channels)
+        spans = [(t[0], t[-1]) for t, _ in channels.values() if len(t)]
+        duration = max(s[1] for s in spans) - min(s[0] for s in spans) if spans else 0.0
+        samples = max((len(t) for t, _ in channels.values()), default=0)
+        with self._connect() as db:
+            db.execute('DELETE FROM runs WHERE path = ?', (path,))
+            run_id = db.execute(
+                'INSERT INTO runs (path, export, start_time, duration, samples, channels, sequence,'
+                ' sequence_hash, abort_reason, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, export, start_time, float(duration), samples, ','.join(channels),
+                 sequence and os.path.basename(sequence),
+                 sequence_hash(steps) if steps is not None else None,
+                 abort_reason, time.time())).lastrowid
+            db.executemany('INSERT INTO channel_stats VALUES (?, ?, ?, ?, ?, ?)',
+                           [(run_id, name, *s) for name, s in stats.items()])
+        return run_id
+
+    def add_file(self, path, **meta):
+        '''add() a log file in any format analysis.load_run() reads.'''
+        from analysis import load_run
+        channels, info = load_run(path)
+        meta.setdefault('start_time', info['start_time'])
+        return self.add(path, channels, **meta)
+
+    def runs(self, conditions=(), aborted=None, sequence_hash=None):
+        '''
+        Runs (sqlite3.Row) meeting every condition, oldest first.  aborted
+        True/False keeps only runs with/without an abort reason;
+        sequence_hash matches a hash prefix.
+        '''
+        where, args = [], []
+        for condition in conditions:
+            channel, stat, op, number = parse_condition(condition)
+            # stat and op come from fixed lists, so only the values are parameters
+            where.append(f'EXISTS (SELECT 1 FROM channel_stats s WHERE s.run_id = runs.id '
+                         f'AND s.channel = ? AND s.{stat} {op} ?)')
+            args += [channel, number]
+        if aborted is not None:
+            where.append(f'abort_reason IS {"NOT " if aborted else ""}NULL')
+        if sequence_hash:
+            where.append('sequence_hash LIKE ?')
+            args.append(sequence_hash + '%')
+        sql = 'SELECT * FROM runs'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        with self._connect() as db:
+            return db.execute(sql + ' ORDER BY start_time, id', args).fetchall()
+
+    def stats(self, run_id):
+        '''{channel: (samples, min, max, mean)} of one run.'''
+        with self._connect() as db:
+            rows = db.execute('SELECT channel, samples, min, max, mean FROM channel_stats '
+                              'WHERE run_id = ? ORDER BY rowid', (run_id,)).fetchall()
+        return {row['channel']: tuple(row)[1:] for row in rows}
+
+
+def format_runs(rows):
+    '''One line per run: id, start, duration, samples, sequence, abort reason, path.'''
+    lines = []
+    for row in rows:
+        start = (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['start_time']))
+                 if row['start_time'] is not None else '-' * 19)
+        sequence = f"{row['sequence'] or '-'} {row['sequence_hash'][:8]}" if row['sequence_hash'] else '-'
+        lines.append(f"{row['id']:>4}  {start}  {row['duration']:8.2f} s  {row['samples']:>7}  "
+                     f"{sequence:<24}  {row['abort_reason'] or '-':<24}  {row['path']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog', default=CATALOG_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('add', help="index log files (any format analysis.py reads)")
+    p.add_argument('logs', nargs='+')
+    p.add_argument('--sequence', help="the sequence CSV the runs used")
+    p.add_argument('--abort', help="abort reason to record")
+    commands.add_parser('list', help="every run")
+    p = commands.add_parser('query', help="runs meeting every condition")
+    p.add_argument('conditions', nargs='*')
+    p.add_argument('--aborted', action='store_true', default=None, help="only aborted runs")
+    p.add_argument('--sequence-hash', help="only runs of this sequence (hash prefix)")
+    p = commands.add_parser('show', help="one run's channel summaries")
+    p.add_argument('run_id', type=int)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.command == 'add':
+        steps = None
+        if args.sequence:
+            from sequencer import load_sequence
+            steps = load_sequence(args.sequence)
+        for path in args.logs:
+            run_id = catalog.add_file(path, sequence=args.sequence, steps=steps, abort_reason=args.abort)
+            print(f"{path}: run {run_id}")
+    elif args.command == 'show':
+        for channel, (samples, low, high, mean) in catalog.stats(args.run_id).items():
+            if samples:
+                print(f"  {channel:<8} {samples:>7} samples  min {low:10.2f}  max {high:10.2f}  mean {mean:10.2f}")
+            else:
+                print(f"  {channel:<8} no samples")
+    else:
+        started = time.perf_counter()
+        try:
+            rows = (catalog.runs() if args.command == 'list' else
+                    catalog.runs(args.conditions, args.aborted, args.sequence_hash))
+        except ValueError as e:
+            parser.error(str(e))
+        elapsed = time.perf_counter() - started
+        if rows:
+            print(format_runs(rows))
+        print(f"{len(rows)} runs ({elapsed * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+'''
+Lossless, quantization-aware compression for logged channels (.blpz).
+
+Pressure and thrust readings sit on a fixed ADC step (OPD_01 in
+2.13.26.txt only takes 18.54, 19.76, 20.99, 22.21, ... about 1.2207 psi
+apart) and sample times are near-uniform, so both reduce to small
+integers:
+
+  values  the ADC step and offset are detected and each sample becomes its
+          integer code; consecutive codes are delta coded
+  times   the ticks of the times' decimal resolution, delta-of-delta coded,
+          so a steady sample rate is a run of zeros
+
+The deltas are zigzag mapped to unsigned, stored in the smallest integer
+type that holds them and deflated.  A column that is not on a step falls
+back to the integers of its decimal resolution, then to float32 if it is
+exactly float32 (bulk telemetry frames), then to raw float64; every column
+is decoded again while encoding and must come back bit for bit.  Decoding
+is one inflate plus cumulative sums and a multiply-add per column.
+
+    python channel_codec.py 2.13.26.txt runs/run_*.blprec   # -> .blpz beside each
+
+A legacy log is archived as written: its timestamps, bogus jumps and all,
+are encoded unrepaired and the header's "legacy_times" tells readers
+(analysis.load_run) to repair them when the file is read, so the .blpz
+decodes to exactly the source log.
+
+File layout: MAGIC, header length (I), JSON header, column data.  The
+header holds {"version", "start_time", "source", "notes", "legacy_times",
+"columns": [{"codec", "order", "head", "count", "dtype", ..., "offset",
+"size"}], "channels": [{"name", "time", "values"}]} with "time"/"values"
+indexing columns.
+'''
+
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b'BLPZ1\n'
+_LENGTH = struct.Struct('<I')
+# 2: an ADC column's zero is "zero"; version 1 wrote its byte "offset" over it
+VERSION = 2
+
+# most decimal places looked for when turning floats into integer ticks
+MAX_DECIMALS = 6
+
+# most ADC levels the fitted step may round wrong and still be used; the
+# fit is least squares, so a level or two lands just over half a tick out
+MAX_LEVEL_FIXES = 16
+
+# codecs, best first; each column uses the first that is lossless for it
+CODECS = ('adc', 'decimal', 'float32', 'raw')
+
+
+def _zigzag(x):
+    return ((x << 1) ^ (x >> 63)).view(np.uint64)
+
+
+def _unzigzag(z):
+    z = z.astype(np.uint64, copy=False)
+    return (z >> np.uint64(1)).view(np.int64) ^ -(z & np.uint64(1)).view(np.int64)
+
+
+def _smallest_uint(z):
+    top = int(z.max()) if len(z) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if top <= np.iinfo(dtype).max:
+            return z.astype(dtype)
+    return z
+
+
+def _pack_ints(ints, order):
+    '''(params, bytes) for an int64 array coded as `order`-th differences.'''
+    head = []
+    for _ in range(order):
+        if len(ints):
+            head.append(int(ints[0]))
+        ints = np.diff(ints)
+    packed = _smallest_uint(_zigzag(ints))
+    return {'order': order, 'head': head, 'dtype': packed.dtype.str}, zlib.compress(packed.tobytes(), 6)
+
+
+def _unpack_ints(column, data):
+    ints = _unzigzag(np.frombuffer(zlib.decompress(data), dtype=column['dtype']))
+    for head in reversed(column['head']):
+        ints = np.concatenate(([head], ints)).cumsum()
+    return ints
+
+
+def _decimals(x):
+    '''Fewest decimal places that hold every value of x exactly, or None.'''
+    for d in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** d
+        ticks = np.rint(x * scale)
+        if np.all(np.abs(ticks) < 2 ** 52) and np.array_equal(ticks / scale, x):
+            return d
+    return None
+
+
+def _adc_step(ticks):
+    '''
+    (step, offset) with ticks close to rint(offset + code * step) for
+    integer codes, in tick units, when ticks sit on a coarser regular grid;
+    None otherwise.
+    '''
+    levels = np.unique(ticks)
+    if len(levels) < 3:
+        return None
+    gaps = np.diff(levels)
+    smallest = gaps[gaps <= 2 * gaps.min()]
+    guess = float(np.median(smallest))
+    if guess < 2:
+        return None   # already one tick per level, nothing to gain
+    codes = np.rint((levels - levels[0]) / guess)
+    step, offset = np.polyfit(codes, levels.astype(float), 1)
+    return float(step), float(offset)
+
+
+def encode_column(x, order):
+    '''
+    (column params, data) for float array x, differences of `order` for the
+    integer codecs (1 for readings, 2 for times).
+    '''
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    candidates = []
+    if len(x) and np.all(np.isfinite(x)):
+        d = _decimals(x)
+        if d is not None:
+            ticks = np.rint(x * 10.0 ** d).astype(np.int64)
+            fit = _adc_step(ticks) if order == 1 else None
+            if fit is not None:
+                step, offset = fit
+                codes = np.rint((ticks - offset) / step).astype(np.int64)
+                # levels the fitted grid rounds wrong: [code, tick correction]
+                levels, first = np.unique(codes, return_index=True)
+                miss = ticks[first] - np.rint(offset + levels * step).astype(np.int64)
+                fixes = [[int(c), int(m)] for c, m in zip(levels[miss != 0], miss[miss != 0])]
+                if len(fixes) <= MAX_LEVEL_FIXES:
+                    params, data = _pack_ints(codes, order)
+                    candidates.append(({'codec': 'adc', 'decimals': d, 'step': step, 'zero': offset,
+                                        'fixes': fixes, **params}, data))
+            params, data = _pack_ints(ticks, order)
+            candidates.append(({'codec': 'decimal', 'decimals': d, **params}, data))
+    # values beyond float32's range are not float32 (and would warn when cast)
+    in_range = np.all(np.abs(x[np.isfinite(x)]) <= np.finfo(np.float32).max)
+    if in_range and np.array_equal(x.astype(np.float32).astype(np.float64), x, equal_nan=True):
+        candidates.append(({'codec': 'float32'}, zlib.compress(x.astype('<f4').tobytes(), 6)))
+    candidates.append(({'codec': 'raw'}, zlib.compress(x.astype('<f8').tobytes(), 6)))
+
+    for column, data in candidates:
+        column['count'] = len(x)
+        if np.array_equal(decode_column(column, data), x, equal_nan=True):
+            return column, data
+    raise AssertionError("raw float64 did not round trip")
+
+
+def decode_column(column, data):
+    codec = column['codec']
+    if codec == 'raw':
+        return np.frombuffer(zlib.decompress(data), dtype='<f8')
+    if codec == 'float32':
+        return np.frombuffer(zlib.decompress(data), dtype='<f4').astype(np.float64)
+    ints = _unpack_ints(column, data)
+    if codec == 'adc':
+        codes = ints
+        ints = np.rint(column['zero'] + codes * column['step'])
+        for code, fix in column['fixes']:
+            ints[codes == code] += fix
+    return ints / 10.0 ** column['decimals']
+
+
+def write_compressed(path, channels, start_time=None, source=None, notes=None,
+                     legacy_times=False):
+    '''
+    Write {channel: (times, values)} to `path`.  Channels with identical
+    times share one time column.  legacy_times marks times taken from a
+    legacy log unrepaired.  Returns the header.
+    '''
+    columns, blobs, entries = [], [], []
+    times_seen = []   # (array, column index)
+
+    def add(x, order):
+        column, data = encode_column(x, order)
+        columns.append(column)
+        blobs.append(data)
+        return len(columns) - 1
+
+    for name, (times, values) in channels.items():
+        times = np.asarray(times, dtype=np.float64)
+        shared = next((i for t, i in times_seen if np.array_equal(t, times)), None)
+        if shared is None:
+            shared = add(times, 2)
+            times_seen.append((times, shared))
+        entries.append({'name': name, 'time': shared, 'values': add(values, 1)})
+
+    offset = 0
+    for column, data in zip(columns, blobs):
+        column['offset'], column['size'] = offset, len(data)
+        offset += len(data)
+    header = {'version': VERSION, 'start_time': start_time, 'source': source, 'notes': notes,
+              'legacy_times': legacy_times, 'columns': columns, 'channels': entries}
+    text = json.dumps(header).encode()
+    with open(path, 'wb') as f:
+        f.write(MAGIC + _LENGTH.pack(len(text)) + text)
+        for data in blobs:
+            f.write(data)
+    return header
+
+
+def read_compressed(path, channels=None):
+    '''
+    (header, {channel: (times, values)}) for the named channels, or all;
+    only their columns are inflated.
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a compressed log")
+        length, = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length).decode())
+        if header['version'] != VERSION:
+            raise ValueError(f"{path}: version {header['version']}, expected {VERSION}")
+        base = f.tell()
+        decoded = {}
+
+        def column(i):
+            if i not in decoded:
+                info = header['columns'][i]
+                f.seek(base + info['offset'])
+                decoded[i] = decode_column(info, f.read(info['size']))
+            return decoded[i]
+
+        wanted = [c for c in header['channels'] if channels is None or c['name'] in channels]
+        return header, {c['name']: (column(c['time']), column(c['values'])) for c in wanted}
+
+
+def main():
+    from binlog import BinaryLog, convert_channels
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', nargs='+', help="legacy CSV logs, .blprec recordings or .blplog logs")
+    args = parser.parse_args()
+
+    for src in args.sources:
+        if src.endswith('.blplog'):
+            with BinaryLog(src) as log:
+                channels = {name: (np.array(log.times(name)), np.array(log.values(name)))
+                            for name in log.channels}
+                meta = {'start_time': log.start_time, 'source': log.header['source'],
+                        'notes': log.header.get('notes')}
+        else:
+            # lossless against the source: legacy times are repaired on read
+            channels, meta = convert_channels(src, repair=False)
+            meta['legacy_times'] = not src.endswith('.blprec')
+        dst = os.path.splitext(src)[0] + '.blpz'
+        header = write_compressed(dst, channels, **meta)
+
+        started = time.perf_counter()
+        _, decoded = read_compressed(dst)
+        elapsed = time.perf_counter() - started
+        samples = sum(len(t) for t, _ in channels.values())
+        size = os.path.getsize(dst)
+        out_bytes = 8 * sum(len(t) + len(v) for t, v in decoded.values())
+        print(f"{src} ({os.path.getsize(src)} bytes) -> {dst} ({size} bytes, "
+              f"{size / max(samples, 1):.2f} bytes/sample, "
+              f"{os.path.getsize(src) / size:.1f}x); decodes at {out_bytes / elapsed / 1e6:.0f} MB/s")
+        for entry in header['channels']:
+            t, v = header['columns'][entry['time']], header['columns'][entry['values']]
+            step = f" step {v['step'] / 10 ** v['decimals']:.5g}" if v['codec'] == 'adc' else ""
+            print(f"  {entry['name']:<8} values {v['codec']}{step} ({v['size']} bytes), "
+                  f"times {t['codec']} ({t['size']} bytes)")
+
+
+if __name__ == '__main__':
+    main()
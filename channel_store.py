@@ -0,0 +1,105 @@
+'''
+Columnar in-memory store for acquired samples.
+
+One float64 row per channel plus a time row, preallocated and grown in
+chunks, so an append is a couple of array stores instead of seven boxed
+Python floats and a row list (~56 bytes per sample instead of ~330), and
+every read - plots, warnings, CSV export - gets zero-copy views.
+
+With capacity set, the store is a fixed-size ring holding the most recent
+`capacity` samples.  Each sample is written twice, at i and i + capacity,
+so the live window is always one contiguous slice and views stay zero-copy
+even across the wrap.
+'''
+
+import numpy as np
+
+
+class ChannelStore:
+    def __init__(self, channels, chunk=65536, capacity=None):
+        self.channels = tuple(channels)
+        self.index = {name: i + 1 for i, name in enumerate(self.channels)}
+        self.chunk = chunk
+        self.capacity = capacity
+        self.count = 0   # samples ever appended
+        width = 2 * capacity if capacity else chunk
+        # row 0 is time, row i the channel with index[name] == i
+        self.data = np.full((len(self.channels) + 1, width), np.nan)
+
+    def __len__(self):
+        if self.capacity:
+            return min(self.count, self.capacity)
+        return self.count
+
+    def _span(self):
+        if self.capacity and self.count > self.capacity:
+            start = self.count % self.capacity
+            return start, start + self.capacity
+        return 0, len(self)
+
+    def _grow(self, needed):
+        width = self.data.shape[1]
+        new_width = max(width + self.chunk, width + width // 2, needed)
+        grown = np.empty((self.data.shape[0], new_width))
+        grown[:, :self.count] = self.data[:, :self.count]
+        self.data = grown
+
+    def append(self, t, values):
+        i = self.count
+        if self.capacity:
+            i %= self.capacity
+            self.data[0, i] = self.data[0, i + self.capacity] = t
+            self.data[1:, i] = self.data[1:, i + self.capacity] = values
+        else:
+            if i == self.data.shape[1]:
+                self._grow(i + 1)
+            self.data[0, i] = t
+            self.data[1:, i] = values
+        self.count += 1
+
+    def extend(self, times, rows):
+        '''Append a block: times has n entries, rows is n x channels.'''
+        times = np.asarray(times, dtype=float)
+        rows = np.asarray(rows, dtype=float).reshape(len(times), len(self.channels))
+        if self.capacity:
+            for t, values in zip(times, rows):
+                self.append(t, values)
+            return
+        n = len(times)
+        if self.count + n > self.data.shape[1]:
+            self._grow(self.count + n)
+        self.data[0, self.count:self.count + n] = times
+        self.data[1:, self.count:self.count + n] = rows.T
+        self.count += n
+
+    # -- zero-copy views of the live samples, oldest first --
+    @property
+    def times(self):
+        start, stop = self._span()
+        return self.data[0, start:stop]
+
+    def column(self, name):
+        start, stop = self._span()
+        return self.data[self.index[name], start:stop]
+
+    def columns(self):
+        '''All channels as one (channels x samples) view.'''
+        start, stop = self._span()
+        return self.data[1:, start:stop]
+
+    def latest(self):
+        '''The newest sample as {channel: value}, or None when empty.'''
+        if not len(self):
+            return None
+        i = self._span()[1] - 1
+        return dict(zip(self.channels, self.data[1:, i].tolist()))
+
+    def window(self, seconds):
+        '''(start, stop) indices into the views covering the last `seconds`.'''
+        times = self.times
+        if not len(times):
+            return 0, 0
+        return int(np.searchsorted(times, times[-1] - seconds)), len(times)
+
+    def clear(self):
+        self.count = 0
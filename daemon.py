@@ -0,0 +1,529 @@
+'''
+Headless test stand: acquisition, valve commands, the sequencer, abort and
+logging in one process, controlled over a local socket.
+
+    python daemon.py                          # Unix socket /tmp/blp.sock
+    python daemon.py --tcp 127.0.0.1:5600
+
+The GUI (Updated_GUI.py with BLP_DAEMON set) is then just one client: if
+the display stalls or crashes, sampling, valve timing and the log carry on.
+
+Requests are one JSON object per line, {"cmd": name, "args": [...]}, and
+each gets one JSON line back, {"ok": true, "result": ...} or
+{"ok": false, "error": message}.  See Stand.COMMANDS for the names.
+
+Anyone who can reach the socket can move valves.  The Unix socket is
+only open to its owner; TCP listens on loopback unless a token is given
+(--token or BLP_DAEMON_TOKEN), which every request must then carry as
+"token" (clients read the same variable).
+'''
+
+import argparse
+import csv
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from catalog import CATALOG_PATH, Catalog
+from channel_store import ChannelStore
+from frames import CHANNELS
+from pycode import Telemetry, System_Health, Metrics
+from pycode import V1, V2, V3, V4
+from recorder import RECORD_DIR, Recorder, recording_path
+from redline import REDLINES, Redlines
+from sequencer import PACKET_STEPS, Sequencer, compile_sequence, describe, load_sequence
+
+DEFAULT_SOCKET = '/tmp/blp.sock'
+
+# valve name -> data packet slot
+VALVES = {'FV-02': V1, 'FV-03': V2, 'OV-03': V3, 'NV-02': V4}
+
+# drain the acquisition stream into the log this often (seconds)
+COLLECT_PERIOD = 0.02
+
+
+class Stand:
+    '''
+    Everything the GUI used to own apart from drawing: the Telemetry link,
+    valve state, the sequencer, abort and the run log.  Thread safe; the
+    socket server calls it from one thread per client.
+    '''
+
+    # commands a client may call, see handle()
+    COMMANDS = ('status', 'samples', 'start', 'abort', 'command', 'open_valve',
+                'close_valve', 'spark', 'run_sequence', 'stop_sequence', 'metrics')
+
+    def __init__(self, tel, log_path=RECORD_DIR, acquire=True,
+                 clock=time.monotonic, sleep=None, catalog_path=CATALOG_PATH):
+        self.tel = tel
+        # a CSV file, or a directory for a timestamped CSV per run; None: keep no log
+        self.log_path = log_path
+        self.acquire = acquire     # False: commands only, as in simulation.py
+        # every recorded run is indexed here when it ends (catalog.py)
+        self.catalog = Catalog(catalog_path) if catalog_path and acquire and log_path else None
+        # one packet edit + send at a time, from any client or the sequencer
+        self.lock = threading.RLock()
+        self.store = ChannelStore(CHANNELS)
+        self.valve_status = {'NV-02': 0, 'FV-02': 0, 'FV-03': 0, 'OV-03': 0}
+        self.state = 'idle'
+        self.start_time = None
+        self.sequencer = Sequencer(self.actions(), metrics=tel.metrics, clock=clock, sleep=sleep)
+        # checked on the acquisition thread, every sample
+        self.redlines = Redlines(REDLINES, on_abort=self._redline_abort, metrics=tel.metrics)
+        self.recorder = None   # the run on disk, written as it is acquired
+        self._finisher = None  # saves and catalogs an aborted run off the caller's thread
+        self.sequence_path = None   # what the catalog notes about the run
+        self.sequence_steps = None
+        self._collector = None
+        self._collecting = threading.Event()
+
+    # -- acquisition and logging --
+    def start(self):
+        with self.lock:
+            if self.state == 'running':
+                return self.state
+            if self._finisher is not None:
+                self._finisher.join()   # the last run's log is read from the store
+            print("Test started")
+            self.store.clear()
+            self.start_time = time.time()
+            self.redlines.reset()
+            if self.acquire:
+                if self.log_path:
+                    self.recorder = Recorder(recording_path(), start_time=self.start_time,
+                                             metrics=self.tel.metrics)
+                    print(f"Recording to {self.recorder.path}")
+                self.tel.start_stream(on_sample=self.redlines.check_sample)
+                self._collecting.set()
+                self._collector = threading.Thread(target=self._collect, name="collector", daemon=True)
+                self._collector.start()
+            self.state = 'running'
+            return self.state
+
+    def _collect(self):
+        while True:
+            # one last drain after the stop, so the log and the catalog get
+            # the samples of the final period (a redline abort's among them)
+            collecting = self._collecting.is_set()
+            samples = self.tel.get_samples()
+            if self.recorder is not None:
+                self.recorder.extend(samples)
+            for sample_time, values in samples:
+                if values and len(values) >= len(CHANNELS):
+                    self.store.append(sample_time - self.start_time, values[:len(CHANNELS)])
+            if not collecting:
+                break
+            time.sleep(COLLECT_PERIOD)
+
+    def _stop_acquisition(self):
+        self._collecting.clear()
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
+        self.tel.stop_stream()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def save_log(self, path=None):
+        '''Same layout as the GUI's export: one row of "t:v" pairs per sensor.'''
+        path = path or self.log_path
+        if not os.path.splitext(path)[1]:
+            path = recording_path(path, self.start_time, suffix='.csv')
+        times = self.store.times.tolist()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Sensor", "Time"])
+            for sensor in CHANNELS:
+                values = self.store.column(sensor).tolist()
+                writer.writerow([sensor, ", ".join(f"{t:.2f}:{v}" for t, v in zip(times, values))])
+        print(f"Data saved to {path}.")
+        return path
+
+    def _finish_run(self, abort_reason):
+        '''Export the CSV log and index the run in the catalog.'''
+        export = self.save_log() if self.log_path else None
+        if self.catalog is not None:
+            times = self.store.times
+            channels = {sensor: (times, self.store.column(sensor)) for sensor in CHANNELS}
+            path = self.recorder.path if self.recorder is not None else export
+            run_id = self.catalog.add(path, channels, start_time=self.start_time, export=export,
+                                      sequence=self.sequence_path, steps=self.sequence_steps,
+                                      abort_reason=abort_reason)
+            print(f"Catalogued {path} as run {run_id}")
+        self.sequence_path = self.sequence_steps = None
+
+    def samples(self, since=0):
+        '''Samples logged from index `since` on, and the index to ask for next.'''
+        stop = len(self.store)
+        since = min(since, stop)
+        times = self.store.times[since:stop].tolist()
+        rows = self.store.columns()[:, since:stop].T.tolist()
+        return {'start_time': self.start_time, 'next': stop,
+                'samples': list(zip(times, rows)), 'valves': dict(self.valve_status),
+                'warnings': self.redlines.warnings()}
+
+    def status(self):
+        latest = self.store.latest()
+        return {'state': self.state, 'start_time': self.start_time,
+                'samples': len(self.store), 'latest': latest,
+                'recording': self.recorder.path if self.recorder is not None else None,
+                'valves': dict(self.valve_status),
+                'redlines': {'warnings': self.redlines.warnings(),
+                             'events': self.redlines.events[-20:]},
+                'sequence': {'running': self.sequencer.running,
+                             'step': self.sequencer.current_step,
+                             'steps': len(self.sequencer.sequence)},
+                'health': {k: str(v) for k, v in System_Health.py_stats.items()}}
+
+    def metrics(self):
+        return {name: self.tel.metrics.summary(name) for name in self.tel.metrics.samples}
+
+    # -- valves --
+    def command(self, ops):
+        '''
+        Apply staged packet edits and send them as one command; ops are
+        ["open", slot], ["close", slot] or ["spark"] as RemoteTelemetry stages them.
+        '''
+        with self.lock:
+            for op in ops:
+                if op[0] == 'open':
+                    self.tel.open_valve(op[1])
+                elif op[0] == 'close':
+                    self.tel.close_valve(op[1])
+                elif op[0] == 'spark':
+                    self.tel.spark_coil()
+                else:
+                    raise ValueError(f"unknown packet op {op!r}")
+            self.tel.send_data()
+            self._record_ops(ops)
+            return dict(self.valve_status)
+
+    def _record_ops(self, ops):
+        '''Note the valve moves in `ops`; returns them as a message.'''
+        names = {slot: name for name, slot in VALVES.items()}
+        done = []
+        for op in ops:
+            if op[0] in ('open', 'close'):
+                self.valve_status[names[op[1]]] = int(op[0] == 'open')
+                done.append(f"{names[op[1]]} {'opened' if op[0] == 'open' else 'closed'}")
+            else:
+                done.append('spark sent')
+        return ", ".join(done)
+
+    def _send_planned(self, packet, payload):
+        with self.lock:
+            self.tel.send_packet(packet, payload)
+
+    def open_valve(self, name):
+        self.command([('open', VALVES[name])])
+        print(f"{name} opened")
+        return f"{name} opened"
+
+    def close_valve(self, name):
+        self.command([('close', VALVES[name])])
+        print(f"{name} closed")
+        return f"{name} closed"
+
+    def spark(self):
+        self.command([('spark',)])
+        return 'spark sent'
+
+    def abort(self, reason="operator abort"):
+        # first, outside the lock: from here on the abort thread's packets are
+        # the only commands that go out, and a step mid-send is the last before it
+        self.tel.abort()
+        self.sequencer.stop()
+        with self.lock:
+            self.valve_status.update({'OV-03': 0, 'FV-03': 0, 'FV-02': 1, 'NV-02': 0})
+            print("Test aborted")
+            if self.state == 'running':
+                # the abort packets are out; saving can take longer than a
+                # client waits for the reply, so it runs on its own thread
+                self._finisher = threading.Thread(target=self._finish, args=(reason,),
+                                                  name="finish run", daemon=False)
+                self._finisher.start()
+            self.state = 'aborted'
+            return "Test aborted, data being saved"
+
+    def _finish(self, reason):
+        # not under self.lock, so valve commands stay live while this saves;
+        # start() waits for it before it clears the store
+        self._stop_acquisition()
+        self.tel.metrics.report()
+        self._finish_run(reason)
+
+    # -- sequences --
+    def actions(self):
+        '''
+        Sequence function name -> action, as used in the sequence CSVs.
+        Valve and spark steps (sequencer.PACKET_STEPS) are sent from the
+        compiled plan; their entries here only record the new valve state.
+        '''
+        actions = {
+            'Start_Count': self.start,
+            'Read_OPD_02': lambda: self._arm('OPD_02'),
+            'Read_FPD_02': lambda: self._arm('FPD_02'),
+            'Read_EPD_01': lambda: self._arm('EPD_01'),
+            'BLP_Abort': lambda: self.abort("sequence BLP_Abort"),
+        }
+        for function, ops in PACKET_STEPS.items():
+            actions[function] = lambda ops=ops: self._record_ops(ops)
+        return actions
+
+    def _arm(self, channel):
+        self.redlines.arm(channel)
+        return f"{channel} redline armed"
+
+    def _redline_abort(self, limit, t, value):
+        # on the acquisition thread, one sample after the limit tripped
+        print(f"Redline abort: {limit.message or limit.name} ({limit.channel}={value:g})")
+        self.abort(f"redline {limit.name} ({limit.channel}={value:g})")
+
+    def run_sequence(self, steps, block=False):
+        '''
+        steps: a sequence CSV path on the stand, or [[time, function], ...].
+        With block the sequence runs to the end before this returns.
+        '''
+        path = steps if isinstance(steps, str) else None
+        if path:
+            steps = load_sequence(steps)
+        # raises SequenceError before anything runs
+        plan = compile_sequence(steps, self.actions(), send=self._send_planned,
+                                packet=self.tel.data_packet, current=lambda: self.tel.data_packet)
+        print(describe(plan))
+        self.sequence_path, self.sequence_steps = path, steps
+        if block:
+            self.sequencer.run(plan)
+        else:
+            self.sequencer.start(plan)
+        return len(plan)
+
+    def stop_sequence(self):
+        self.sequencer.stop()
+        return self.sequencer.current_step
+
+    def handle(self, cmd, args=()):
+        if cmd not in self.COMMANDS:
+            raise ValueError(f"unknown command {cmd!r}")
+        return getattr(self, cmd)(*args)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        token = self.server.token
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if token and not hmac.compare_digest(str(request.get('token', '')), token):
+                    raise PermissionError("bad or missing token")
+                reply = {'ok': True,
+                         'result': self.server.stand.handle(request['cmd'], request.get('args', []))}
+            except Exception as e:
+                reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(reply) + '\n').encode())
+
+
+class UnixControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TcpControlServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_address(text):
+    '''"host:port" -> (host, port); anything else is a Unix socket path.'''
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit() and '/' not in text:
+        return host, int(port)
+    return text
+
+
+def _loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_server(stand, address=DEFAULT_SOCKET, token=None):
+    '''
+    A control server for `stand`.  Off loopback, TCP needs a token: the
+    socket accepts valve and abort commands.
+    '''
+    if isinstance(address, tuple):
+        if not token and not _loopback(address[0]):
+            raise ValueError(f"refusing to listen on {address[0] or 'every interface'} "
+                             "without a token; use 127.0.0.1 or pass --token")
+        server = TcpControlServer(address, _Handler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)   # stale socket from a previous run
+        server = UnixControlServer(address, _Handler)
+        os.chmod(address, 0o600)
+    server.stand = stand
+    server.token = token
+    return server
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+class DaemonClient:
+    '''Blocking JSON-lines client for the control socket.'''
+
+    def __init__(self, address=DEFAULT_SOCKET, timeout=5.0, token=None):
+        self.address = address
+        self.timeout = timeout
+        self.token = token or os.environ.get('BLP_DAEMON_TOKEN')
+        self.sock = None
+        self.rfile = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        family = socket.AF_INET if isinstance(self.address, tuple) else socket.AF_UNIX
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.address)
+        self.rfile = self.sock.makefile('rb')
+
+    def close(self):
+        if self.sock is not None:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = self.rfile = None
+
+    def call(self, cmd, *args):
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            try:
+                request = {'cmd': cmd, 'args': args}
+                if self.token:
+                    request['token'] = self.token
+                self.sock.sendall((json.dumps(request) + '\n').encode())
+                line = self.rfile.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionError("daemon closed the connection")
+        reply = json.loads(line)
+        if not reply['ok']:
+            raise DaemonError(reply['error'])
+        return reply['result']
+
+
+class RemoteTelemetry:
+    '''
+    The slice of pycode.Telemetry the GUI uses, forwarded to a daemon, so
+    the GUI runs unchanged as a client.  open_valve()/close_valve()/
+    spark_coil() stage packet edits and send_data() sends them as one command.
+    '''
+
+    def __init__(self, address=DEFAULT_SOCKET):
+        self.client = DaemonClient(address)
+        self.metrics = Metrics()   # GUI-side timings (render)
+        self.valve_status = {}
+        self._ops = []
+        self._next = 0
+        self.warnings = []   # redline warnings tripped on the daemon
+
+    def open_valve(self, num):
+        self._ops.append(('open', num))
+        return 0
+
+    def close_valve(self, num):
+        self._ops.append(('close', num))
+        return 0
+
+    def spark_coil(self):
+        self._ops.append(('spark',))
+        return 0
+
+    def send_data(self):
+        if self._ops:
+            ops, self._ops = self._ops, []
+            self.valve_status = self.client.call('command', ops)
+        return 0
+
+    def start_test(self):
+        return 0
+
+    def abort(self):
+        # the daemon sends the abort packets and replies; it stops acquisition
+        # and saves its log on its own afterwards
+        self._ops = []
+        self.client.call('abort')
+        return 0
+
+    def start_stream(self, capacity=4096, period=0.0, on_sample=None):
+        # redlines run on the daemon's acquisition thread, not here
+        self.client.call('start')
+        self._next = 0
+        return 0
+
+    def stop_stream(self):
+        return 0
+
+    def get_samples(self):
+        reply = self.client.call('samples', self._next)
+        self._next = reply['next']
+        self.valve_status = reply['valves']
+        self.warnings = reply['warnings']
+        start = reply['start_time'] or 0.0
+        return [(start + t, values) for t, values in reply['samples']]
+
+    def get_data(self):
+        return list((self.client.call('status')['latest'] or {}).values())
+
+    def run_sequence(self, steps):
+        return self.client.call('run_sequence', steps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless test stand daemon")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument('--unix', default=DEFAULT_SOCKET, help="control socket path")
+    where.add_argument('--tcp', help="listen on host:port instead")
+    parser.add_argument('--log', default=RECORD_DIR,
+                        help="CSV run log written on abort, or a directory for one per run")
+    parser.add_argument('--catalog', default=CATALOG_PATH, help="run catalog the runs are indexed in")
+    parser.add_argument('--token', default=os.environ.get('BLP_DAEMON_TOKEN'),
+                        help="secret every request must carry; needed to listen off loopback")
+    args = parser.parse_args()
+
+    stand = Stand(Telemetry(System_Health), log_path=args.log, catalog_path=args.catalog)
+    address = parse_address(args.tcp) if args.tcp else args.unix
+    try:
+        server = make_server(stand, address, args.token)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Stand daemon listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if stand.state == 'running':
+            # keep what was acquired; valves are left as they are
+            stand._finish("daemon stopped")
+        elif stand._finisher is not None:
+            stand._finisher.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+'''
+Peak-preserving decimation for plotting long histories.
+
+Plotting every sample of a 30 minute fill is millions of points per frame
+for a few hundred pixel columns.  Min/max decimation keeps, for each bucket
+of consecutive samples, the sample with the smallest and the one with the
+largest value, so a spike narrower than a pixel still reaches the screen.
+'''
+
+import numpy as np
+
+
+def minmax_decimate(x, y, buckets):
+    '''
+    Reduce (x, y) to at most 2 * buckets points, keeping each bucket's min
+    and max in time order.  Buckets that are all NaN (link gaps) keep one NaN
+    point so the plotted line still breaks there.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2 * buckets:
+        return x, y
+    width = -(-n // buckets)
+    full = n // width
+    out_x, out_y = _bucket_minmax(x[:full * width].reshape(full, width),
+                                  y[:full * width].reshape(full, width))
+    if full * width < n:
+        tail_x, tail_y = _bucket_minmax(x[full * width:][None, :], y[full * width:][None, :])
+        out_x = np.concatenate((out_x, tail_x))
+        out_y = np.concatenate((out_y, tail_y))
+    return out_x, out_y
+
+
+def _bucket_minmax(xb, yb):
+    '''Rows of xb/yb are buckets; returns two points per bucket, interleaved.'''
+    rows = np.arange(len(yb))
+    gaps = np.isnan(yb)
+    lo = np.argmin(np.where(gaps, np.inf, yb), axis=1)
+    hi = np.argmax(np.where(gaps, -np.inf, yb), axis=1)
+    first = np.minimum(lo, hi)
+    second = np.maximum(lo, hi)
+    out_x = np.empty(2 * len(yb))
+    out_y = np.empty(2 * len(yb))
+    out_x[0::2] = xb[rows, first]
+    out_x[1::2] = xb[rows, second]
+    out_y[0::2] = yb[rows, first]
+    out_y[1::2] = yb[rows, second]
+    return out_x, out_y
+
+
+class MinMaxDecimator:
+    '''
+    Incremental min/max summary of one channel, kept at `target` to
+    2 * `target` buckets however long the run gets.
+
+    Samples fill the current bucket; every `width` samples it is closed.
+    When 2 * target buckets are closed, neighbours are merged pairwise and
+    `width` doubles, so appends stay amortized O(1) and memory stays fixed.
+    '''
+
+    def __init__(self, target=500):
+        self.target = target
+        self.width = 1
+        size = 2 * target
+        # closed buckets: the (time, value) of each one's min and max
+        self.t_lo = np.empty(size)
+        self.v_lo = np.empty(size)
+        self.t_hi = np.empty(size)
+        self.v_hi = np.empty(size)
+        self.count = 0
+        self._open = []   # (t, v) of the bucket being filled
+
+    def __len__(self):
+        return self.count * self.width + len(self._open)
+
+    def append(self, t, v):
+        self._open.append((t, v))
+        if len(self._open) >= self.width:
+            self._close()
+
+    def extend(self, ts, vs):
+        for t, v in zip(ts, vs):
+            self.append(t, v)
+
+    def _close(self):
+        lo = hi = None
+        for t, v in self._open:
+            if v != v:
+                continue
+            if lo is None or v < lo[1]:
+                lo = (t, v)
+            if hi is None or v > hi[1]:
+                hi = (t, v)
+        if lo is None:
+            lo = hi = self._open[0]   # all NaN: keep the gap
+        i = self.count
+        self.t_lo[i], self.v_lo[i] = lo
+        self.t_hi[i], self.v_hi[i] = hi
+        self.count += 1
+        self._open = []
+        if self.count == len(self.v_lo):
+            self._merge()
+
+    def _merge(self):
+        '''Halve the number of buckets by merging neighbours pairwise.'''
+        n = self.count // 2
+        for t_arr, v_arr, pick in ((self.t_lo, self.v_lo, np.less_equal),
+                                   (self.t_hi, self.v_hi, np.greater_equal)):
+            a_t, b_t = t_arr[0:2 * n:2], t_arr[1:2 * n:2]
+            a_v, b_v = v_arr[0:2 * n:2], v_arr[1:2 * n:2]
+            # NaN never wins against a real value
+            take_a = pick(a_v, b_v) | np.isnan(b_v)
+            t_arr[:n] = np.where(take_a, a_t, b_t)
+            v_arr[:n] = np.where(take_a, a_v, b_v)
+        self.count = n
+        self.width *= 2
+
+    def points(self):
+        '''Decimated (x, y) for plotting, in time order.'''
+        n = self.count
+        x = np.empty(2 * n)
+        y = np.empty(2 * n)
+        lo_first = self.t_lo[:n] <= self.t_hi[:n]
+        x[0::2] = np.where(lo_first, self.t_lo[:n], self.t_hi[:n])
+        y[0::2] = np.where(lo_first, self.v_lo[:n], self.v_hi[:n])
+        x[1::2] = np.where(lo_first, self.t_hi[:n], self.t_lo[:n])
+        y[1::2] = np.where(lo_first, self.v_hi[:n], self.v_lo[:n])
+        if self._open:
+            ts, vs = zip(*self._open)
+            tail_x, tail_y = minmax_decimate(ts, vs, 1)
+            x = np.concatenate((x, tail_x))
+            y = np.concatenate((y, tail_y))
+        return x, y
@@ -0,0 +1,205 @@
+'''
+Binary frame formats shared by the host and the Arduino firmware.
+
+Telemetry frame (device -> host), answered to a single BULK_POLL byte.
+Little endian, fixed size:
+
+    [0xAA 0x55][seq u16][device ms u32][OPD_01 f32][OPD_02 f32][EPD_01 f32]
+    [FPD_01 f32][FPD_02 f32][THRUST f32][crc16 u16]
+
+Command frame (host -> device), sent with one write:
+
+    [0xAA 0x5A][seq u16][len u8][payload][crc16 u16]
+
+The payload is the exact byte string the legacy per-byte protocol sends
+(one "[" + str(slot) + "," group per data_packet slot), so firmware only has
+to strip the header and feed the payload to its existing parser.  It answers with an ack frame:
+
+    [0xAA 0x5B][seq u16][crc16 u16]
+
+The crc is CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) over every byte
+before it, sync included.  Channel order matches the list returned by
+UART.receive_response().
+'''
+
+import binascii
+import struct
+
+SYNC = b'\xaa\x55'
+BULK_POLL = b'%'
+
+CHANNELS = ('OPD_01', 'OPD_02', 'EPD_01', 'FPD_01', 'FPD_02', 'THRUST')
+
+COMMAND_SYNC = b'\xaa\x5a'
+ACK_SYNC = b'\xaa\x5b'
+
+_TELEMETRY = struct.Struct('<2sHI%df' % len(CHANNELS))
+_CRC = struct.Struct('<H')
+
+_COMMAND_HEADER = struct.Struct('<2sHB')
+_ACK = struct.Struct('<2sH')
+
+TELEMETRY_FRAME_SIZE = _TELEMETRY.size + _CRC.size
+ACK_FRAME_SIZE = _ACK.size + _CRC.size
+
+
+class FrameError(ValueError):
+    '''Raised when a frame is short, misaligned or fails its crc.'''
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_telemetry(seq, device_ms, values):
+    body = _TELEMETRY.pack(SYNC, seq & 0xFFFF, device_ms & 0xFFFFFFFF, *values)
+    return body + _CRC.pack(crc16(body))
+
+
+def decode_telemetry(buf):
+    '''
+    Decode one telemetry frame.
+    Returns (seq, device_ms, values) where values is a tuple of floats.
+    '''
+    if len(buf) != TELEMETRY_FRAME_SIZE:
+        raise FrameError(f"short telemetry frame ({len(buf)} of {TELEMETRY_FRAME_SIZE} bytes)")
+    body = memoryview(buf)[:_TELEMETRY.size]
+    (crc,) = _CRC.unpack_from(buf, _TELEMETRY.size)
+    if crc != crc16(body):
+        raise FrameError("telemetry frame crc mismatch")
+    sync, seq, device_ms, *values = _TELEMETRY.unpack(body)
+    if sync != SYNC:
+        raise FrameError("telemetry frame missing sync")
+    return seq, device_ms, tuple(values)
+
+
+def encode_legacy_command(packet):
+    '''
+    The byte string UART.send_message() puts on the wire for `packet`,
+    built in one buffer.
+    '''
+    return b''.join(b'[' + str(slot).encode() + b',' for slot in packet)
+
+
+def encode_command(seq, packet, payload=None):
+    '''payload: encode_legacy_command(packet), if already computed.'''
+    if payload is None:
+        payload = encode_legacy_command(packet)
+    if len(payload) > 0xFF:
+        raise FrameError(f"command payload too long ({len(payload)} bytes)")
+    body = _COMMAND_HEADER.pack(COMMAND_SYNC, seq & 0xFFFF, len(payload)) + payload
+    return body + _CRC.pack(crc16(body))
+
+
+# bytes the per-byte firmware acts on: command slots, polls and digits
+_LEGACY_BYTES = frozenset(b'[,%&A0123456789')
+
+
+def probe_command():
+    '''
+    (seq, frame) of a command with an empty payload, sent once when the
+    link opens to learn whether the firmware acks framed commands before
+    any real command depends on it.  The seq is picked so no byte of the
+    frame is one the per-byte firmware acts on, so it ignores the probe.
+    '''
+    for seq in range(0x10000):
+        frame = encode_command(seq, (), b'')
+        if not _LEGACY_BYTES.intersection(frame):
+            return seq, frame
+    raise FrameError("no probe frame free of legacy bytes")
+
+
+def decode_command(buf):
+    '''Returns (seq, payload) from one command frame.'''
+    if len(buf) < _COMMAND_HEADER.size + _CRC.size:
+        raise FrameError("short command frame")
+    sync, seq, length = _COMMAND_HEADER.unpack_from(buf)
+    end = _COMMAND_HEADER.size + length
+    if sync != COMMAND_SYNC or len(buf) != end + _CRC.size:
+        raise FrameError("malformed command frame")
+    (crc,) = _CRC.unpack_from(buf, end)
+    if crc != crc16(memoryview(buf)[:end]):
+        raise FrameError("command frame crc mismatch")
+    return seq, bytes(buf[_COMMAND_HEADER.size:end])
+
+
+def encode_ack(seq):
+    body = _ACK.pack(ACK_SYNC, seq & 0xFFFF)
+    return body + _CRC.pack(crc16(body))
+
+
+def decode_ack(buf):
+    if len(buf) != ACK_FRAME_SIZE:
+        raise FrameError(f"short ack frame ({len(buf)} of {ACK_FRAME_SIZE} bytes)")
+    (crc,) = _CRC.unpack_from(buf, _ACK.size)
+    sync, seq = _ACK.unpack_from(buf)
+    if sync != ACK_SYNC or crc != crc16(memoryview(buf)[:_ACK.size]):
+        raise FrameError("bad ack frame")
+    return seq
+
+
+_LENGTH = struct.Struct('<H')
+
+
+def length_prefixed(payload):
+    '''Wrap a payload for a stream link: [len u16][payload].'''
+    if len(payload) > 0xFFFF:
+        raise FrameError(f"payload too long ({len(payload)} bytes)")
+    return _LENGTH.pack(len(payload)) + payload
+
+
+class StreamFramer:
+    '''
+    Reassembles length_prefixed() frames from a stream socket (TCP, RFCOMM).
+
+    Reads go straight into one preallocated buffer with recv_into(), and
+    frames come back as memoryview slices of it, so steady-state reception
+    allocates nothing per packet.  A returned frame is only valid until the
+    next recv; copy it with bytes() to keep it.
+    '''
+
+    def __init__(self, sock, size=65536):
+        self.sock = sock
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0   # first byte not yet handed out
+        self.end = 0     # end of received data
+        self.pending = []
+
+    def recv_frames(self):
+        '''
+        One recv_into() call; returns every frame it completed (possibly
+        none).  Raises ConnectionError when the peer closes the link.
+        '''
+        view = self.view
+        if self.start:
+            # move the partial frame to the front; at most one frame long
+            remaining = self.end - self.start
+            view[:remaining] = view[self.start:self.end]
+            self.start, self.end = 0, remaining
+        if self.end == len(self.buf):
+            raise FrameError("frame larger than the receive buffer")
+        n = self.sock.recv_into(view[self.end:])
+        if n == 0:
+            raise ConnectionError("link closed by peer")
+        self.end += n
+
+        out = []
+        start, end = self.start, self.end
+        while end - start >= _LENGTH.size:
+            (length,) = _LENGTH.unpack_from(self.buf, start)
+            stop = start + _LENGTH.size + length
+            if stop > end:
+                break
+            out.append(view[start + _LENGTH.size:stop])
+            start = stop
+        if start == end:
+            start = end = 0
+        self.start, self.end = start, end
+        return out
+
+    def recv_frame(self):
+        '''Block until the next complete frame and return it.'''
+        while not self.pending:
+            self.pending = self.recv_frames()
+        return self.pending.pop(0)
@@ -0,0 +1,150 @@
+'''
+Reader for the GUI's legacy CSV test logs (save_data_to_csv and the
+daemon's save_log): one row per sensor, its whole run in one cell of
+"t:v, t:v, ..." pairs, e.g. 2.13.26.txt.
+
+Each cell is parsed in one vectorized pass: the ':' separators are
+translated to ',' at the byte level and numpy parses the result straight
+into a float array of interleaved times and values, with no Python object
+per pair.
+
+Logs written before the GUI's time base was fixed have bogus timestamps:
+the GUI sometimes timed samples from another start time, so stretches of a
+run jump back (0.00 then -313.90, -313.89, ... in 2.13.26.txt) or forward
+by tens of seconds.  repair_times() fixes those as a separate, reported
+step; load_legacy_log() returns the times as written.
+
+    python legacy_log.py 2.13.26.txt 2.13.26.2.txt    # load and report repairs
+'''
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+
+# forward jumps longer than this (seconds) are treated as a timestamp
+# fault, not a pause in acquisition (link stalls of ~1 s do happen)
+MAX_GAP = 5.0
+
+# save_data_to_csv writes times with two decimals
+RESOLUTION = 0.01
+
+_PAIR_SEPARATOR = bytes.maketrans(b':', b',')
+
+
+def _parse_cell(cell):
+    '''Interleaved (time, value) floats of one "t:v, t:v" cell, as an n x 2 array.'''
+    expected = 2 * (cell.count(b',') + 1)
+    with warnings.catch_warnings():
+        # depending on the numpy version a malformed pair ends the parse early
+        # with a DeprecationWarning or raises; either way it is reported below
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            data = np.fromstring(cell.translate(_PAIR_SEPARATOR), dtype=float, sep=',')
+        except ValueError:
+            data = None
+    if data is None or data.size != expected:
+        raise ValueError(f"malformed t:v pair among {expected // 2}")
+    return data.reshape(-1, 2)
+
+
+def load_legacy_log(path):
+    '''
+    {sensor: (times, values)} as float64 arrays, in file order.  Header
+    rows ("Sensor,Time", "Sensor,Time:Value Pairs") and rows with no
+    pairs (the stray trailing "h" of 2.13.26.2.txt) are skipped.
+    '''
+    with open(path, 'rb') as f:
+        text = f.read()
+    channels = {}
+    for number, line in enumerate(text.splitlines(), start=1):
+        name, _, cell = line.partition(b',')
+        name = name.strip().decode()
+        cell = cell.strip().strip(b'"').strip()
+        if not cell or name == 'Sensor':
+            continue
+        try:
+            data = _parse_cell(cell)
+        except ValueError as e:
+            raise ValueError(f"{path} line {number} ({name}): {e}") from None
+        channels[name] = (data[:, 0].copy(), data[:, 1].copy())
+    return channels
+
+
+def repair_times(times, max_gap=MAX_GAP, resolution=RESOLUTION):
+    '''
+    Make a run's sample times continuous.  Every step that goes back, or
+    forward by more than max_gap, is replaced with the run's typical sample
+    period (the median step), and everything after it moves with it.
+    Returns (repaired times, [(index, original step)] for each replaced
+    step, index being the sample after it).  Where the true spacing is
+    lost the run comes out about a period longer per replaced step.
+    '''
+    times = np.asarray(times, dtype=float)
+    if len(times) < 2:
+        return times.copy(), []
+    steps = np.diff(times)
+    bad = (steps < 0) | (steps > max_gap)
+    if not bad.any():
+        return times.copy(), []
+    period = float(np.median(steps[~bad])) if (~bad).any() else resolution
+    shift = np.concatenate(([0.0], np.cumsum(np.where(bad, period - steps, 0.0))))
+    repaired = np.round(times + shift, int(round(-np.log10(resolution))))
+    fixes = [(int(i) + 1, float(steps[i])) for i in np.flatnonzero(bad)]
+    return repaired, fixes
+
+
+def repair_log(channels, max_gap=MAX_GAP):
+    '''
+    repair_times() on every channel of a load_legacy_log() result.  Returns
+    (repaired channels, {sensor: (fixes, seconds the last sample moved)})
+    with only the sensors that needed it.
+    '''
+    repaired = {}
+    report = {}
+    for name, (times, values) in channels.items():
+        fixed, fixes = repair_times(times, max_gap)
+        repaired[name] = (fixed, values)
+        if fixes:
+            report[name] = (fixes, float(fixed[-1] - times[-1]))
+    return repaired, report
+
+
+def format_repairs(report, limit=5):
+    '''The repairs, one line per group of sensors repaired alike, listing the first `limit` fixes.'''
+    groups = {}
+    for name, (fixes, moved) in report.items():
+        groups.setdefault((tuple(fixes), moved), []).append(name)
+    lines = []
+    for (fixes, moved), names in groups.items():
+        shown = ", ".join(f"#{i} ({step:+.2f} s)" for i, step in fixes[:limit])
+        more = f" and {len(fixes) - limit} more" if len(fixes) > limit else ""
+        lines.append(f"{', '.join(names)}: {len(fixes)} timestamp jumps replaced with the sample "
+                     f"period: {shown}{more}; last sample moved {moved:+.2f} s")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP,
+                        help="longest forward step kept as a real pause (s)")
+    args = parser.parse_args()
+
+    for path in args.logs:
+        started = time.perf_counter()
+        channels = load_legacy_log(path)
+        elapsed = time.perf_counter() - started
+        samples = sum(len(t) for t, _ in channels.values())
+        print(f"{path}: {len(channels)} sensors, {samples} samples in {elapsed * 1000:.1f} ms")
+        channels, report = repair_log(channels, args.max_gap)
+        print(format_repairs(report) or "timestamps continuous, nothing to repair")
+        for name, (times, _) in channels.items():
+            if len(times):
+                print(f"  {name:<8} {len(times):>7} samples  {times[0]:.2f} .. {times[-1]:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+'''
+Fast redraw helpers for the GUI's matplotlib canvases.
+'''
+
+import time
+
+import numpy as np
+
+
+class BlitRenderer:
+    '''
+    Redraws only the line artists of one canvas.
+
+    The static parts (axes, ticks, grid, labels) are rasterized once and
+    cached; each update restores that background, draws the lines and blits
+    the result.  A full canvas.draw() only happens when the data leaves the
+    current axis limits, and the limits then grow with headroom so that
+    happens rarely.  Feed it decimated data (decimate.py) so the limit check
+    and line drawing stay proportional to pixels, not history length.
+    '''
+
+    def __init__(self, canvas, headroom=0.5):
+        self.canvas = canvas
+        self.headroom = headroom
+        self.plots = []      # (ax, line)
+        self.fitted = []     # whether each plot's limits have been fitted to data yet
+        self.background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add(self, ax, line):
+        line.set_animated(True)
+        ax.set_autoscale_on(False)
+        self.plots.append((ax, line))
+        self.fitted.append(False)
+
+    def _on_draw(self, event):
+        # any full draw (first show, resize, rescale) refreshes the cache
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for ax, line in self.plots:
+            ax.draw_artist(line)
+
+    def _fit_limits(self, i, x, y):
+        '''
+        Adjust plot i's limits if the data left them (or, for y, shrank to a
+        small part of them).  Returns True when the limits changed.
+        '''
+        if not len(x):
+            return False
+        ax = self.plots[i][0]
+        changed = False
+
+        x0, x1 = ax.get_xlim()
+        lo_x, hi_x = x[0], x[-1]
+        if not self.fitted[i] or hi_x >= x1 or lo_x < x0:
+            ax.set_xlim(lo_x, hi_x + max(hi_x - lo_x, 1.0) * self.headroom)
+            changed = True
+
+        y = np.asarray(y, dtype=float)
+        finite = y[~np.isnan(y)]   # NaN marks link gaps
+        if len(finite):
+            lo, hi = finite.min(), finite.max()
+            y0, y1 = ax.get_ylim()
+            pad = (hi - lo) * self.headroom / 2 or max(abs(hi) * 0.05, 1.0)
+            if (not self.fitted[i] or lo < y0 or hi > y1
+                    or (hi - lo + 2 * pad) < (y1 - y0) * 0.2):
+                ax.set_ylim(lo - pad, hi + pad)
+                changed = True
+            self.fitted[i] = True
+        return changed
+
+    def update(self, data):
+        '''data: one (x, y) pair per added line, in order.'''
+        rescale = False
+        for i, ((ax, line), (x, y)) in enumerate(zip(self.plots, data)):
+            line.set_data(x, y)
+            if self._fit_limits(i, x, y):
+                rescale = True
+
+        if rescale or self.background is None:
+            self.canvas.draw()   # _on_draw recaptures the background
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_lines()
+            self.canvas.blit(self.canvas.figure.bbox)
+
+
+class Dashboard:
+    '''
+    Every channel on one figure and one canvas, sharing the time axis.
+
+    layout is a list of (channel, title, ylabel), placed row-major over
+    `columns`.  With a single canvas a frame is one Agg rasterization of
+    the lines and one Tk blit, however many channels are shown, where
+    separate canvases pay for each.
+    '''
+
+    def __init__(self, master, layout, columns=3, figsize=(15, 6), dpi=100, blit=True):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        rows = -(-len(layout) // columns)
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        axes = self.fig.subplots(rows, columns, sharex=True, squeeze=False).ravel()
+        self.axes = {}
+        self.lines = {}
+        for i, (ax, (channel, title, ylabel)) in enumerate(zip(axes, layout)):
+            ax.set_title(title, fontsize=12)
+            ax.set_ylabel(ylabel, fontsize=10)
+            ax.grid(True)
+            if i + columns >= len(layout):
+                # lowest plot in its column carries the shared time axis
+                ax.set_xlabel("Time (s)", fontsize=10)
+                ax.xaxis.set_tick_params(labelbottom=True)
+            line, = ax.plot([], [])
+            self.axes[channel] = ax
+            self.lines[channel] = line
+        for ax in axes[len(layout):]:
+            ax.set_visible(False)   # unused cells of the grid
+        self.fig.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.renderer = None
+        if blit:
+            self.renderer = BlitRenderer(self.canvas)
+            for channel in self.lines:
+                self.renderer.add(self.axes[channel], self.lines[channel])
+
+    def update(self, data):
+        '''data: {channel: (x, y)} for every channel in the layout.'''
+        if self.renderer is not None:
+            self.renderer.update([data[channel] for channel in self.lines])
+            return
+        for channel, line in self.lines.items():
+            line.set_data(*data[channel])
+            self.axes[channel].relim()
+            self.axes[channel].autoscale_view()
+        self.canvas.draw()
+
+
+class RenderScheduler:
+    '''
+    Calls render() on the Tk loop at a fixed frame rate, independent of how
+    fast data arrives.  Deadlines are absolute, so a slow frame does not push
+    every later frame back; slots that have already passed are dropped and
+    counted instead of being drawn late.
+    '''
+
+    def __init__(self, window, render, fps=30, metrics=None):
+        self.window = window
+        self.render = render
+        self.period = 1.0 / fps
+        self.metrics = metrics
+        self.frames = 0
+        self.dropped = 0
+        self.render_time = 0.0   # seconds the last frame took
+        self.fps = 0.0           # frames drawn over the last second
+        self.after_id = None
+        self._deadline = None
+        self._window_start = None
+        self._window_frames = 0
+
+    def start(self):
+        if self.after_id is None:
+            self._deadline = self._window_start = time.perf_counter()
+            self._window_frames = 0
+            self._tick()
+
+    def stop(self):
+        if self.after_id is not None:
+            self.window.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _tick(self):
+        now = time.perf_counter()
+        late = now - self._deadline
+        if late >= self.period:
+            missed = int(late // self.period)
+            self.dropped += missed
+            self._deadline += missed * self.period
+
+        self.render()
+        done = time.perf_counter()
+        self.render_time = done - now
+        if self.metrics is not None:
+            self.metrics.record('render', self.render_time)
+        self.frames += 1
+        self._window_frames += 1
+        if done - self._window_start >= 1.0:
+            self.fps = self._window_frames / (done - self._window_start)
+            self._window_start, self._window_frames = done, 0
+
+        self._deadline += self.period
+        delay = max(0, int((self._deadline - time.perf_counter()) * 1000))
+        self.after_id = self.window.after(delay, self._tick)
@@ -11,17 +11,17 @@ Created: 6/28/24
 
 # dependencies
 
-# wifi
-import socket
-import numpy
-import json
-import struct
-import serial
-from threading import Timer
+import threading
+from collections import deque
 import time
 #from serial_pc import BT
-import uart_code1
-from test_sequ_excel import test_sequence
+# importing the driver is side-effect free: the port opens on first use.
+# Always this repo's UART.py: an installed legacy uart_code1 opens the port
+# at import and lacks send_command()/reconnect()
+import UART as uart_code1
+from acquisition import Acquisition
+from supervisor import Supervisor
+import frames
 
 # global variables
 V1 = 0
@@ -38,6 +38,38 @@ T = 5
 CS = 6
 A = 7
 
+# packet slot value that opens / closes each valve, and fires the coil
+OPEN_CODES = {V1: [1], V2: [2], V3: [3], V4: [4]}
+CLOSE_CODES = {V1: ["!"], V2: ["@"], V3: ["#"], V4: ["$"]}
+SPARK_CODE = ['B']
+
+
+def apply_op(packet, op):
+    '''
+    Apply one packet edit in place: ("open", slot), ("close", slot) or
+    ("spark",), the same change open_valve()/close_valve()/spark_coil() make.
+    '''
+    if op[0] == 'open':
+        packet[op[1]] = list(OPEN_CODES[op[1]])
+    elif op[0] == 'close':
+        packet[op[1]] = list(CLOSE_CODES[op[1]])
+    elif op[0] == 'spark':
+        packet[C] = list(SPARK_CODE)
+    else:
+        raise ValueError(f"unknown packet op {op!r}")
+
+
+# Abort stages: (seconds after the abort request, packet edits).  OV-03 and
+# NV-02 close and FV-02 opens at once; FV-03 closes half a second later.
+ABORT_STAGES = (
+    (0.0, (('close', V3), ('open', V1), ('close', V4))),
+    (0.5, (('close', V2),)),
+)
+
+
+class CommandPreempted(RuntimeError):
+    '''A command was dropped because an abort is being sent.'''
+
 
 # ToDo: add anymore numbers for front end
 # SERIAL_PORT = "COM7"  # Change this based on your system
@@ -128,6 +160,9 @@ class Wifi_Host:
         self.connection = None
         self.addy = None
         '''
+        self.connection = None
+        # reassembles length-prefixed frames, created with the connection
+        self.framer = None
 
 
     def send_command(self, d):
@@ -136,7 +171,7 @@ class Wifi_Host:
         [heartbeat][data layer][aborts][status data]
         '''
         # form packet
-        sent = self.connection.sendall(d)
+        sent = self.connection.sendall(frames.length_prefixed(d))
         System_Health.py_stats["wifi message tx"] = 'good'
 
         if (sent == 0):
@@ -149,22 +184,23 @@ class Wifi_Host:
         telemetry packet:
         [heartbeat][data layer][status data]
         '''
-        packet_size = 1024
-        self.data = self.connection.recv(packet_size)
-        #print(type(self.data))
-
-        if (self.data == ''):
+        # one whole frame however TCP split or merged it, as a memoryview
+        # into the framer's buffer (valid until the next call)
+        if self.framer is None or self.framer.sock is not self.connection:
+            self.framer = frames.StreamFramer(self.connection)
+        try:
+            self.data = self.framer.recv_frame()
+        except (ConnectionError, frames.FrameError):
             System_Health.py_stats["wifi message rx"] = 'bad'
             raise RuntimeError("did not recieve packet")
-        else:
-            System_Health.py_stats["wifi message rx"] = 'good'
+        System_Health.py_stats["wifi message rx"] = 'good'
 
         return self.data
 
 
 # processes incoming data and forms outgoing data packets
 class Telemetry:
-    def __init__(self, sys):
+    def __init__(self, sys, link=None, abort_options=None):
         # default
         # 32 bits for 32 commands -> bitwise operations for processing
         self.heartbeat = -49  # checksum for verification
@@ -172,11 +208,23 @@ class Telemetry:
         self.data = [[0], [0], [0], [0], [0], [0],[0],[0]]
         # self.wifi       = wifi
         self.sys = sys
+        self.metrics = Metrics()
+        # anything with receive_response()/send_command()/reconnect(): the UART
+        # module by default, or a transport.Link over serial, Bluetooth, Wifi
+        # or loopback; supervised so dropouts reconnect and show up as gaps
+        self.link = Supervisor(uart_code1 if link is None else link, self.metrics, sys)
 
         # data packet       v1     v2    v3    v4   C     T     CS     A
         #self.data_packet = [0], [0], [0], [0], [0], [0], [0]]
         self.data_packet = [0,0,0,0,0,0,0,0]
         self.rx_data = []
+        # one command at a time, so none slips out between an abort's trigger and its packets
+        self.command_lock = threading.Lock()
+        # sends abort() off the caller's thread, ahead of any other command;
+        # abort_options are AbortController's clock, sleep and threaded
+        self.aborter = AbortController(self, **(abort_options or {}))
+        # background acquisition thread, see start_stream()
+        self.stream = None
         # connects to ESP32
         #self.sock = BT.connect_to_esp32()
         # all this class does is set and clear bits for the fized data packets coming in and out
@@ -197,15 +245,67 @@ class Telemetry:
         # self.wifi.send_command(self.send_data_out())
         #BT.send_data(self.sock, self.data_packet)
         #print(self.data_packet)
-        uart_code1.send_message(self.data_packet)
-
+        self.send_packet(self.data_packet)
         return 0
+
+    def send_packet(self, packet, payload=None, force=False):
+        '''
+        Send `packet` as the data packet and return the link's
+        (seq, wire, ack) timing.  payload is its precomputed wire bytes
+        (frames.encode_legacy_command), as sequencer.compile_sequence
+        prepares them, so a countdown step does no encoding.
+
+        While an abort is in progress anything but the abort's own packets
+        (force=True) raises CommandPreempted instead of going out.
+        '''
+        with self.command_lock:
+            if self.aborter.active.is_set() and not force:
+                raise CommandPreempted("abort in progress, command dropped")
+            self.data_packet = list(packet)
+            seq, wire, ack = self.link.send_command(self.data_packet, payload)
+            self.metrics.record('command wire', wire)
+            if ack is not None:
+                self.metrics.record('command ack', ack)
+            System_Health.py_stats['command latency'] = f'{(ack or wire) * 1000:.1f} ms'
+            return seq, wire, ack
         
     
+    def start_stream(self, capacity=4096, period=0.0, on_sample=None):
+        '''
+        Hand the link to a background acquisition thread that samples at the
+        link's full rate; drain it with get_samples().  on_sample(t, values)
+        runs on that thread for every sample (redline checks).
+        '''
+        if self.stream is None:
+            self.link.stopped.clear()
+            self.stream = Acquisition(self.link.receive_response, capacity, period, on_sample)
+            self.stream.start()
+        return 0
+
+    def stop_stream(self):
+        if self.stream is not None:
+            self.link.stopped.set()  # give up any reconnect in progress
+            self.stream.stop()
+            self.stream = None
+        return 0
+
+    def get_samples(self):
+        '''
+        Every (timestamp, values) sample acquired since the last call.
+        Without a running stream this polls once.
+        '''
+        if self.stream is None:
+            return [(time.time(), self.get_data())]
+        return self.stream.buffer.drain()
+
     # function that starts processing the incoming data
     def get_data(self):
+        if self.stream is not None:
+            # the acquisition thread owns the port; hand back its newest sample
+            latest = self.stream.buffer.latest()
+            return latest[1] if latest else []
         #print('reading')
-        msg = uart_code1.receive_response()
+        msg = self.link.receive_response()
         #print('recieved')
         #print(msg)
         return msg
@@ -275,33 +375,21 @@ class Telemetry:
             case 4:
                 return ser.writelines('v4')
         '''
-        if(num == V1):
-            self.data_packet[num] = [1]
-        if(num == V2):
-            self.data_packet[num] = [2]
-        if(num == V3):
-            self.data_packet[num] = [3]
-        if(num == V4):
-            self.data_packet[num] = [4]
+        if num in OPEN_CODES:
+            apply_op(self.data_packet, ('open', num))
             
         System_Health.py_stats["v f'{num} open command"] = 'good'
         return 0
 
     def close_valve(self, num):
         # clear msb
-        if(num == V1):
-            self.data_packet[num] = ["!"]
-        if(num == V2):
-            self.data_packet[num] = ["@"]
-        if(num == V3):
-            self.data_packet[num] = ["#"]
-        if(num == V4):
-            self.data_packet[num] = ["$"]
+        if num in CLOSE_CODES:
+            apply_op(self.data_packet, ('close', num))
         System_Health.py_stats["v{num} open command"] = 'bad'
         return 0
 
     def spark_coil(self):
-        self.data_packet[C] = ['B']
+        apply_op(self.data_packet, ('spark',))
         #self.data_packet[C] = ['D']
          #System_Health.py_stats["v{num} open command"] = 'bad'  # status gets cleared from pi side
         return 0
@@ -314,19 +402,16 @@ class Telemetry:
         
     def abort(self):
         #self.data_packet[A] = ['7']
-        self.data_packet[V3] = ["#"]
-        self.data_packet[V1] = [1]
-        self.data_packet[V4] = ["$"]
-        time.sleep(0.5)   
-        self.data_packet[V2] = ["@"]
+        # ABORT_STAGES go out from the abort thread; this returns at once
+        self.aborter.trigger()
         return 0
-        print('pycode abort')
 
         #uart_code1.send_message(self.data_packet)
 
     def upload_test_sequence(self, file_path):
         # parse excel test sequence
         # print("upload test sequence")
+        from test_sequ_excel import test_sequence
         ts = test_sequence(file_path)
         td = ['TEST']
         td = ts.parse_test()
@@ -335,36 +420,208 @@ class Telemetry:
         BT.send_data(self.sock, td)
 
 
-# collects data and visualizes it for System_Health analysis
-
-# todo finish this class
-class Metrics:
-    def __init__(self):
-        print("metrics")
-
-
-
-t = 0
-#for i in range(100):
- #uart_code1.send_message(str(t % 4))
- #t +=1
-
-for i in range(2):
-    sys = System_Health
-    tel = Telemetry(sys)
-    #data = tel.get_data()
-    #print(data)
-
-
-
-
-
-
-
-
-
+class AbortController:
+    '''
+    Sends ABORT_STAGES for a Telemetry, each stage at its offset from the
+    moment trigger() was called.
+
+    The stages run on a standing thread, so trigger() costs the GUI or
+    sequencer thread nothing, and while they run Telemetry.send_packet()
+    drops every other command: a sequence step or button press queued
+    behind the abort never reopens a valve after it.  Waits are on absolute
+    deadlines, sleeping until SPIN seconds before and spinning the rest.
+
+    A stage that fails to send is retried, backing off from RETRY to
+    MAX_RETRY, until it goes out or DEADLINE seconds after it was due; a
+    stage that never went out is reported in System_Health.py_stats['abort']
+    and unconfirmed() names the valves it left uncommanded.
+
+    Every abort is kept in `history` with, per stage, how late it went
+    out, due-to-wire time (trigger-to-wire for the first stage) and
+    wire-to-ack time; those also go to metrics as 'abort stage late',
+    'abort wire' and 'abort ack'.
+
+    For simulation pass a virtual clock's clock and sleep and threaded=False;
+    the stages then run in the caller, with waits that jump the clock
+    forward, and no thread is started (see simulation.py).
+    '''
 
+    SPIN = 0.002
+    # wait before a failed stage send is retried, doubled each time up to
+    # MAX_RETRY, so a link that is reconnecting gets a chance to come back
+    RETRY = 0.02
+    MAX_RETRY = 0.5
+    # seconds after its due time that a stage is given up on; long enough
+    # for the supervisor to reopen the link more than once
+    DEADLINE = 10.0
+
+    def __init__(self, tel, stages=ABORT_STAGES, clock=time.perf_counter, sleep=None,
+                 threaded=True):
+        self.tel = tel
+        self.stages = stages
+        self.clock = clock
+        self.sleep = sleep
+        self.history = []
+        self.active = threading.Event()   # set from trigger() until the last stage is sent
+        self.done = threading.Event()
+        self._trigger_lock = threading.Lock()   # the acquisition, sequencer and Tk threads all trigger
+        self._requested = None
+        self._wake = threading.Event()
+        self._thread = None
+        if threaded:
+            self._thread = threading.Thread(target=self._serve, name="abort", daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        '''Start an abort now.  False if one is already in progress.'''
+        requested = self.clock()
+        with self._trigger_lock:
+            if self.active.is_set():
+                return False
+            self._requested = requested
+            self.done.clear()
+            self.active.set()
+        if self._thread is not None:
+            self._wake.set()
+        else:
+            self._execute()
+        return True
+
+    def wait(self, timeout=None):
+        '''Block until the current abort has sent its last stage.'''
+        return self.done.wait(timeout)
+
+    def _serve(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self._execute()
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self.clock()
+        if self.sleep is not None:
+            self.sleep(max(0.0, remaining))   # virtual clock: jump straight there
+            return
+        if remaining > self.SPIN:
+            time.sleep(remaining - self.SPIN)
+        while self.clock() < deadline:
+            pass
+
+    def _execute(self):
+        requested = self._requested
+        record = {'requested': requested, 'stages': []}
+        try:
+            packet = list(self.tel.data_packet)
+            for delay, ops in self.stages:
+                self._wait_until(requested + delay)
+                for op in ops:
+                    apply_op(packet, op)
+                stage = self._send_stage(packet, requested, delay)
+                stage['ops'] = ops
+                record['stages'].append(stage)
+        finally:
+            self.history.append(record)
+            try:
+                # reported before done is set, so whoever waits sees the outcome
+                self.report(record)
+            finally:
+                self.active.clear()
+                self.done.set()
+
+    def _send_stage(self, packet, requested, delay):
+        metrics = self.tel.metrics
+        stage = {'delay': delay, 'attempts': 0}
+        give_up = requested + delay + self.DEADLINE
+        retry = self.RETRY
+        while True:
+            stage['attempts'] += 1
+            start = self.clock()
+            try:
+                seq, wire, ack = self.tel.send_packet(packet, force=True)
+            except Exception as e:
+                # keep trying: a closed valve matters more than a late one
+                stage['error'] = e
+                if self.clock() + retry > give_up:
+                    return stage
+                self._wait_until(self.clock() + retry)
+                retry = min(retry * 2, self.MAX_RETRY)
+                continue
+            stage.pop('error', None)
+            stage.update({'late': start - requested - delay,
+                          'wire': start - requested - delay + wire,
+                          'ack': None if ack is None else ack - wire})
+            metrics.record('abort stage late', stage['late'])
+            metrics.record('abort wire', stage['wire'])
+            if ack is not None:
+                metrics.record('abort ack', stage['ack'])
+            return stage
+
+    def unconfirmed(self, record=None):
+        '''
+        Valve slots an abort (the last one by default) failed to command:
+        those of the stages after the last one that went out, as each
+        packet carries every stage before it.
+        '''
+        record = record or (self.history[-1] if self.history else None)
+        slots = []
+        for stage in reversed(record['stages'] if record else ()):
+            if 'error' not in stage:
+                break
+            slots += [op[1] for op in stage['ops'] if len(op) > 1]
+        return slots
+
+    def report(self, record=None):
+        '''Print one abort's stage timing (the last one by default).'''
+        record = record or (self.history[-1] if self.history else None)
+        if record is None:
+            return
+        failed = []
+        for stage in record['stages']:
+            if 'error' in stage:
+                failed.append(f"stage +{stage['delay']:.3f} s not sent after "
+                              f"{stage['attempts']} attempts: {stage['error']}")
+                print(f"Abort {failed[-1]}")
+                continue
+            ack = f"{stage['ack'] * 1000:.2f} ms" if stage['ack'] is not None else "n/a"
+            print(f"Abort stage +{stage['delay']:.3f} s: due to wire {stage['wire'] * 1000:.2f} ms, "
+                  f"wire to ack {ack}, late {stage['late'] * 1000:.3f} ms")
+        System_Health.py_stats['abort'] = 'FAILED: ' + '; '.join(failed) if failed else 'sent'
+        first = record['stages'][0] if record['stages'] else {}
+        if 'wire' in first:
+            System_Health.py_stats['abort latency'] = f"{first['wire'] * 1000:.1f} ms"
 
 
+# collects data and visualizes it for System_Health analysis
 
-            
+class Metrics:
+    '''
+    Rolling timing samples (seconds) by name, e.g. command latency.
+    '''
+    def __init__(self, size=1000):
+        self.size = size
+        self.samples = {}
+
+    def record(self, name, seconds):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.size)
+        self.samples[name].append(seconds)
+
+    def summary(self, name):
+        '''count, mean and percentiles in milliseconds'''
+        values = sorted(self.samples.get(name, ()))
+        if not values:
+            return {'count': 0}
+
+        def pct(p):
+            return values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000
+
+        return {'count': len(values),
+                'mean': sum(values) / len(values) * 1000,
+                'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+                'max': values[-1] * 1000}
+
+    def report(self):
+        for name in self.samples:
+            s = self.summary(name)
+            print(f"{name}: n={s['count']} mean={s['mean']:.2f} ms p50={s['p50']:.2f} "
+                  f"p95={s['p95']:.2f} p99={s['p99']:.2f} max={s['max']:.2f} ms")
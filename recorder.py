@@ -0,0 +1,218 @@
+'''
+Crash-safe run recording.
+
+Samples go to disk while they are acquired instead of all at once when a
+test ends.  A Recorder hands them to a writer thread, which appends them as
+blocks of fixed-size records and fsyncs the file every second or so; an
+open recording is always a valid file up to its last whole block, so a
+crash, a power cut or a closed window loses at most the last flush period.
+Closing writes one final block and returns; nothing is rewritten.
+
+File layout, little-endian:
+    header  MAGIC, channel count (H), start time (d), name bytes length (H),
+            channel names, comma separated
+    block   b'BLK1', record count (I), crc32 of the records (I), records
+    record  time (d), one d per channel
+
+    python recorder.py run.blprec                # summary, recovering a torn tail
+    python recorder.py run.blprec --csv out.csv  # legacy "t:v" CSV export
+'''
+
+import argparse
+import csv
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from frames import CHANNELS
+
+MAGIC = b'BLPREC1\n'
+_HEADER = struct.Struct('<HdH')
+_BLOCK = struct.Struct('<4sII')
+BLOCK_MAGIC = b'BLK1'
+
+# directory new recordings are written to
+RECORD_DIR = 'runs'
+
+Recording = namedtuple('Recording', 'channels start_time times values blocks dropped_bytes')
+
+_CLOSE = object()
+
+
+def recording_path(directory=RECORD_DIR, when=None, suffix='.blprec'):
+    '''A new, timestamped recording path in `directory`, e.g. runs/run_20260213_141502.blprec.'''
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(when))
+    path = os.path.join(directory, f'run_{stamp}{suffix}')
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(directory, f'run_{stamp}_{n}{suffix}')
+    return path
+
+
+class Recorder:
+    '''
+    Appends (time, values) samples to `path` from a background thread.
+
+    append()/extend() only queue the samples, so they are safe on the Tk
+    loop or the acquisition path.  The writer emits a block when `block`
+    samples are waiting or `flush_period` seconds have passed, and fsyncs at
+    most every `fsync_period` seconds.
+    '''
+
+    def __init__(self, path, channels=CHANNELS, start_time=None, block=1024,
+                 flush_period=0.25, fsync_period=1.0, metrics=None):
+        self.path = path
+        self.channels = tuple(channels)
+        self.start_time = time.time() if start_time is None else start_time
+        self.block = block
+        self.flush_period = flush_period
+        self.fsync_period = fsync_period
+        self.metrics = metrics
+        self.samples = 0   # written so far
+        self.blocks = 0
+        self.error = None  # the writer's exception, if it died
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'wb')
+        names = ','.join(self.channels).encode()
+        self._file.write(MAGIC + _HEADER.pack(len(self.channels), self.start_time, len(names)) + names)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def append(self, t, values):
+        self._queue.put((t, values))
+
+    def extend(self, samples):
+        '''Queue an iterable of (time, values) samples, as Telemetry.get_samples() returns.'''
+        for sample in samples:
+            self._queue.put(sample)
+
+    def close(self, timeout=5.0):
+        '''Write what is queued, fsync and close.  Safe to call twice.'''
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join(timeout)
+        return self.path
+
+    def _run(self):
+        pending = []
+        last_write = last_sync = time.monotonic()
+        closing = False
+        try:
+            while not closing:
+                try:
+                    item = self._queue.get(timeout=self.flush_period)
+                    while True:
+                        if item is _CLOSE:
+                            closing = True
+                            break
+                        pending.append(item)
+                        if len(pending) >= self.block:
+                            break
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                now = time.monotonic()
+                if pending and (closing or len(pending) >= self.block
+                                or now - last_write >= self.flush_period):
+                    self._write_block(pending)
+                    pending = []
+                    last_write = now
+                if closing or (self.blocks and now - last_sync >= self.fsync_period):
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    last_sync = now
+        except Exception as e:
+            self.error = e
+            print(f"Recorder failed, {self.path} ends at its last whole block: {e}")
+        finally:
+            self._file.close()
+
+    def _write_block(self, samples):
+        started = time.perf_counter()
+        width = len(self.channels)
+        records = np.array([(t, *values[:width]) for t, values in samples
+                            if values and len(values) >= width], dtype='<f8')
+        if not len(records):
+            return
+        data = records.tobytes()
+        self._file.write(_BLOCK.pack(BLOCK_MAGIC, len(records), zlib.crc32(data)) + data)
+        self.samples += len(records)
+        self.blocks += 1
+        if self.metrics is not None:
+            self.metrics.record('record write', time.perf_counter() - started)
+
+
+def read_recording(path):
+    '''
+    A Recording of every whole, intact block in `path`.  A file cut off
+    mid-block (the writer died) is read up to there; dropped_bytes says how
+    much of its tail was left out.  Raises ValueError if it is not a
+    recording at all.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC) or len(data) < len(MAGIC) + _HEADER.size:
+        raise ValueError(f"{path}: not a recording")
+    count, start_time, name_len = _HEADER.unpack_from(data, len(MAGIC))
+    offset = len(MAGIC) + _HEADER.size
+    channels = tuple(data[offset:offset + name_len].decode().split(','))
+    offset += name_len
+    if len(channels) != count:
+        raise ValueError(f"{path}: header names {len(channels)} channels, expected {count}")
+
+    record_size = 8 * (count + 1)
+    chunks = []
+    blocks = 0
+    while offset + _BLOCK.size <= len(data):
+        magic, n, crc = _BLOCK.unpack_from(data, offset)
+        body = data[offset + _BLOCK.size:offset + _BLOCK.size + n * record_size]
+        if magic != BLOCK_MAGIC or len(body) != n * record_size or zlib.crc32(body) != crc:
+            break
+        chunks.append(np.frombuffer(body, dtype='<f8').reshape(n, count + 1))
+        blocks += 1
+        offset += _BLOCK.size + len(body)
+    records = np.concatenate(chunks) if chunks else np.empty((0, count + 1))
+    return Recording(channels, start_time, records[:, 0], records[:, 1:], blocks, len(data) - offset)
+
+
+def write_legacy_csv(recording, path):
+    '''The GUI's old export: one row per sensor of "t:v" pairs, t from the run start.'''
+    times = (recording.times - recording.start_time).tolist()
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Sensor", "Time"])
+        for i, sensor in enumerate(recording.channels):
+            values = recording.values[:, i].tolist()
+            writer.writerow([sensor, ", ".join(f"{t:.2f}:{v}" for t, v in zip(times, values))])
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording')
+    parser.add_argument('--csv', help="also write the legacy CSV export here")
+    args = parser.parse_args()
+
+    rec = read_recording(args.recording)
+    span = rec.times[-1] - rec.times[0] if len(rec.times) else 0.0
+    print(f"{args.recording}: {len(rec.times)} samples in {rec.blocks} blocks over {span:.3f} s, "
+          f"channels {', '.join(rec.channels)}")
+    if rec.dropped_bytes:
+        print(f"torn tail: {rec.dropped_bytes} bytes after the last whole block left out")
+    if args.csv:
+        print(f"wrote {write_legacy_csv(rec, args.csv)}")
+
+
+if __name__ == '__main__':
+    main()
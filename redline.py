@@ -0,0 +1,185 @@
+'''
+Redlines: per-channel limit checks on every acquired sample.
+
+A limit table (REDLINES, or a CSV through load_limits()) is compiled into
+arrays, so a sample block is checked against every limit in a handful of
+numpy operations however many there are.  Each limit trips when N of its
+last M samples are outside it and, once tripped, only clears when N of M
+are no longer outside it shrunk by its hysteresis band, so a reading
+hovering at the line does not chatter.  Abort limits latch and call
+on_abort straight from the acquisition thread, so a redline is acted on
+within one sample period instead of at the display's refresh rate.
+
+Abort limits start disarmed; a sequence arms them with its Read_* steps
+(Read_OPD_02 arms every abort limit on OPD_02), as a low feed pressure is
+only a fault once the tanks are meant to be pressurized.
+'''
+
+import csv
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from frames import CHANNELS
+
+# low/high of None: no limit on that side.  The channel is outside the
+# limit for `trip` of its last `window` samples to trip; action is 'warn'
+# (shown while tripped) or 'abort' (latched, calls on_abort).
+Limit = namedtuple('Limit', 'name channel low high trip window hysteresis action message',
+                   defaults=(1, 1, 0.0, 'warn', None))
+
+# the GUI's warning label and the sequences' Read_* abort checks
+REDLINES = (
+    Limit('OPD_01 high', 'OPD_01', None, 350, 3, 5, 5.0, 'warn', "Almost too high EPD_01!"),
+    Limit('OPD_01 low', 'OPD_01', 150, None, 3, 5, 5.0, 'warn', "Almost too low EPD_01!"),
+    Limit('OPD_02 high', 'OPD_02', None, 530, 3, 5, 5.0, 'warn', "Almost too high FPD_01!"),
+    Limit('EPD_01 high', 'EPD_01', None, 825, 3, 5, 5.0, 'warn', "Almost too high OPD_01!"),
+    Limit('OPD_02 low', 'OPD_02', 15, None, 3, 5, 0.0, 'abort', "OPD_02 below 15"),
+    Limit('FPD_02 low', 'FPD_02', 15, None, 3, 5, 0.0, 'abort', "FPD_02 below 15"),
+    Limit('EPD_01 low', 'EPD_01', 15, None, 3, 5, 0.0, 'abort', "EPD_01 below 15"),
+)
+
+ACTIONS = ('warn', 'abort')
+
+
+def load_limits(path):
+    '''
+    Limits from a CSV with Name, Channel, Low, High, Trip, Window,
+    Hysteresis, Action and Message columns; blank cells take the defaults.
+    '''
+    def number(row, column, cast, default, line):
+        text = (row.get(column) or '').strip()
+        if not text:
+            return default
+        try:
+            return cast(text)
+        except ValueError:
+            raise ValueError(f"{path} line {line}: bad {column} {text!r}") from None
+
+    limits = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            channel = (row.get('Channel') or '').strip()
+            if not channel:
+                continue
+            action = (row.get('Action') or 'warn').strip().lower()
+            if action not in ACTIONS:
+                raise ValueError(f"{path} line {line}: action must be one of {', '.join(ACTIONS)}")
+            limits.append(Limit(
+                (row.get('Name') or '').strip() or f"{channel} line {line}", channel,
+                number(row, 'Low', float, None, line), number(row, 'High', float, None, line),
+                number(row, 'Trip', int, 1, line), number(row, 'Window', int, 1, line),
+                number(row, 'Hysteresis', float, 0.0, line), action,
+                (row.get('Message') or '').strip() or None))
+    return limits
+
+
+class Redlines:
+    '''
+    Checks sample blocks against a limit table.  check() and check_sample()
+    are meant for the acquisition thread; events keeps every
+    (time, limit name, 'trip' or 'clear', value) in order.  The cost of each
+    check goes to metrics as 'redline check'.
+    '''
+
+    def __init__(self, limits=REDLINES, channels=CHANNELS, on_abort=None, metrics=None):
+        self.limits = tuple(limits)
+        self.channels = tuple(channels)
+        self.on_abort = on_abort   # on_abort(limit, sample time, value), once per arming
+        self.metrics = metrics
+        index = {name: i for i, name in enumerate(self.channels)}
+        problems = []
+        for limit in self.limits:
+            if limit.channel not in index:
+                problems.append(f"{limit.name}: unknown channel {limit.channel!r}")
+            if not 1 <= limit.trip <= limit.window:
+                problems.append(f"{limit.name}: needs 1 <= trip <= window")
+        if problems:
+            raise ValueError("\n".join(problems))
+
+        def column(field, missing):
+            return np.array([missing if getattr(l, field) is None else getattr(l, field)
+                             for l in self.limits], dtype=float)
+
+        self.columns = np.array([index[l.channel] for l in self.limits], dtype=int)
+        self.low = column('low', -np.inf)
+        self.high = column('high', np.inf)
+        band = column('hysteresis', 0.0)
+        self.clear_low = self.low + band
+        self.clear_high = self.high - band
+        self.trip = np.array([l.trip for l in self.limits])
+        self.window = np.array([l.window for l in self.limits])
+        self.latch = np.array([l.action == 'abort' for l in self.limits], dtype=bool)
+        self.depth = int(self.window.max()) if self.limits else 1
+        self.reset()
+
+    def reset(self):
+        '''Clear every trip and the sample history, and disarm the abort limits.'''
+        self.armed = ~self.latch
+        self.tripped = np.zeros(len(self.limits), dtype=bool)
+        # the last `depth` samples' outside-the-limit flags, oldest first
+        self.history = np.zeros((self.depth, len(self.limits)), dtype=bool)
+        self.events = []
+        self.aborted = False
+
+    def arm(self, channel):
+        '''Arm the abort limits on `channel`; returns how many there are.'''
+        which = self.latch & (self.columns == self.channels.index(channel))
+        self.armed = self.armed | which
+        return int(which.sum())
+
+    def warnings(self):
+        '''Messages of the warning limits tripped now.'''
+        return [l.message or l.name for l, tripped in zip(self.limits, self.tripped)
+                if tripped and l.action == 'warn']
+
+    def check_sample(self, t, values):
+        '''Acquisition hook: one (time, values) sample.'''
+        if values and len(values) >= len(self.channels):
+            self.check((t,), (values[:len(self.channels)],))
+
+    def check(self, times, rows):
+        '''Check a block: times has n entries, rows is n x channels.'''
+        started = time.perf_counter()
+        values = np.asarray(rows, dtype=float).reshape(len(times), -1)[:, self.columns]
+        start = 0
+        while start < len(values):
+            block = values[start:]
+            low = np.where(self.tripped, self.clear_low, self.low)
+            high = np.where(self.tripped, self.clear_high, self.high)
+            # NaN (a link gap) compares False, so it never counts as outside
+            outside = ((block < low) | (block > high)) & self.armed
+            flags = np.concatenate((self.history, outside))
+            sums = np.concatenate((np.zeros((1, len(self.limits)), dtype=int),
+                                   np.cumsum(flags, axis=0)))
+            # outside count over each limit's window, ending at every new sample
+            end = np.arange(self.depth + 1, len(flags) + 1)
+            count = sums[end] - np.take_along_axis(sums, end[:, None] - self.window, axis=0)
+            flips = np.where(self.tripped, (count < self.trip) & ~self.latch, count >= self.trip)
+            hit = flips.any(axis=0)
+            if not hit.any():
+                self.history = flags[-self.depth:]
+                break
+            # apply the earliest change, then re-check the rest against the new state
+            first = np.where(hit, flips.argmax(axis=0), len(block))
+            j = int(first.min())
+            self.history = flags[j + 1:j + 1 + self.depth].copy()
+            for i in np.flatnonzero(first == j):
+                self.tripped[i] = not self.tripped[i]
+                self.history[:, i] = self.tripped[i]
+                self._event(times[start + j], i, block[j, i])
+            start += j + 1
+        if self.metrics is not None:
+            self.metrics.record('redline check', time.perf_counter() - started)
+
+    def _event(self, t, i, value):
+        limit = self.limits[i]
+        kind = 'trip' if self.tripped[i] else 'clear'
+        value = float(value)
+        self.events.append((t, limit.name, kind, value))
+        print(f"Redline {limit.name} {kind}: {limit.channel}={value:g}")
+        if kind == 'trip' and limit.action == 'abort' and not self.aborted:
+            self.aborted = True
+            if self.on_abort is not None:
+                self.on_abort(limit, t, value)
@@ -0,0 +1,285 @@
+'''
+Timed test sequence runner, independent of any GUI.
+
+A sequence is a CSV with a Time (or "T+ (s)") and a Function column; each
+Function names an action.  compile_sequence() checks the whole file and
+turns it into a fixed plan before the count starts, and the Sequencer
+runs that plan on its own thread against absolute deadlines on the
+monotonic clock, so a stalled display or a slow step never delays a
+valve command.
+'''
+
+import csv
+import difflib
+import threading
+import time
+from collections import namedtuple
+
+import frames
+from pycode import V1, V2, V3, V4, apply_op
+
+# step pairs whose actual spacing report() checks against the sequence,
+# e.g. the igniter must be lit for its full lead before the fuel valve opens
+CHECKED_OFFSETS = (('Spark', 'FV_03'),)
+
+# columns a sequence file may give step times in
+TIME_COLUMNS = ('Time', 'T+ (s)')
+
+# functions that are a data packet edit, as Telemetry's open_valve(),
+# close_valve() and spark_coil() stage them
+PACKET_STEPS = {
+    'FV_02': (('close', V1),),
+    'NV_02': (('open', V4),),
+    'OV_03': (('open', V3),),
+    'FV_03': (('open', V2),),
+    'Spark': (('spark',),),
+}
+
+# One step of a compiled plan.  packet and payload are the full data packet
+# and its wire bytes for packet steps, None otherwise.
+Step = namedtuple('Step', 'time function action packet payload')
+
+
+class SequenceError(ValueError):
+    '''A sequence that cannot be run; the message lists every problem.'''
+
+
+def load_sequence(path):
+    '''[(seconds, function name)] from a sequence CSV, in file order.'''
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames or ()
+        column = next((c for c in TIME_COLUMNS if c in fields), None)
+        if column is None or 'Function' not in fields:
+            raise SequenceError(f"{path}: needs a Function column and a "
+                                f"{' or '.join(TIME_COLUMNS)} column")
+        steps = []
+        for line, row in enumerate(reader, start=2):
+            function = (row.get('Function') or '').strip()
+            if not function:
+                continue
+            try:
+                steps.append((float(row[column]), function))
+            except (TypeError, ValueError):
+                raise SequenceError(f"{path} line {line}: bad time {row[column]!r}") from None
+        return steps
+
+
+def compile_sequence(steps, actions, send=None, packet=None, current=None):
+    '''
+    Turn (time, function) steps into an immutable plan, a tuple of Step.
+
+    Every function must be in `actions` or, when `send` is given, in
+    PACKET_STEPS, and times may not go backwards; every problem is reported
+    in one SequenceError, with the closest known name for typos.
+
+    With `send`, the data packet each packet step leaves behind is worked
+    out here, starting from `packet`, together with its wire bytes; the
+    step then just calls send(packet, payload) followed by its entry in
+    `actions`, if any (status and display updates).  current() returns the
+    live data packet: if a manual command changed it since the plan was
+    made, the step applies its edit to the live packet instead, so an
+    operator's valve change is not silently undone.
+    '''
+    steps = [(float(t), function) for t, function in steps]
+    known = set(actions) | (set(PACKET_STEPS) if send is not None else set())
+    problems = []
+    for i, (t, function) in enumerate(steps):
+        if function not in known:
+            close = difflib.get_close_matches(function, known, n=1, cutoff=0.6)
+            hint = f", did you mean {close[0]!r}?" if close else ""
+            problems.append(f"step {i + 1} (T={t:g}): unknown function {function!r}{hint}")
+        if i and t < steps[i - 1][0]:
+            problems.append(f"step {i + 1} (T={t:g}): time goes back from T={steps[i - 1][0]:g}")
+    if problems:
+        raise SequenceError("\n".join(problems))
+
+    state = list(packet) if packet is not None else [0] * 8
+    plan = []
+    for t, function in steps:
+        hook = actions.get(function)
+        if send is not None and function in PACKET_STEPS:
+            ops = PACKET_STEPS[function]
+            before = tuple(state)
+            for op in ops:
+                apply_op(state, op)
+            snapshot = tuple(state)
+            payload = frames.encode_legacy_command(snapshot)
+            action = _packet_action(send, current, before, ops, snapshot, payload, hook, function)
+            plan.append(Step(t, function, action, snapshot, payload))
+        else:
+            plan.append(Step(t, function, hook, None, None))
+    return tuple(plan)
+
+
+def _packet_action(send, current, before, ops, packet, payload, hook, function):
+    def action():
+        live = current() if current is not None else None
+        if live is None or tuple(live) == before:
+            send(packet, payload)
+        else:
+            edited = list(live)
+            for op in ops:
+                apply_op(edited, op)
+            print(f"{function}: packet changed since the plan was made, sending live edit")
+            send(edited, None)
+        return hook() if hook is not None else f"{function} sent"
+    return action
+
+
+def describe(plan):
+    '''Timing report of a compiled plan, one line per step.'''
+    lines = ["     T+ (s)   wait (s)  function"]
+    for i, step in enumerate(plan):
+        wait = step.time - plan[i - 1].time if i else 0.0
+        wire = f"  {step.payload.decode()}" if step.payload is not None else ""
+        lines.append(f"{step.time:11.3f} {wait:10.3f}  {step.function}{wire}")
+    if plan:
+        lines.append(f"{len(plan)} steps over {plan[-1].time - plan[0].time:.3f} s")
+    return "\n".join(lines)
+
+
+class Sequencer:
+    '''
+    Runs a compiled plan (or raw (time, function) steps, compiled against
+    `actions`, a {function name: callable} map), timed from start().
+
+    The first step fires at start(); each later one is due its time minus
+    the first step's time after that, on the monotonic clock.  The thread
+    sleeps until just before the next deadline, spins the last SPIN
+    seconds, then fires every step that is due in one pass: same-time
+    steps go out back to back and a late step does not push the ones after
+    it back.  Each fired step is recorded in `log` with its intended and
+    actual time, in the sequence's own terms (a count from T-30 starts at
+    -30.000), and its lateness goes to metrics as 'step late'.
+
+    For simulation pass a virtual clock and its sleep(); waits then jump
+    the clock forward instead of passing real time (see simulation.py).
+    '''
+
+    SPIN = 0.002
+
+    def __init__(self, actions, metrics=None, on_step=None, clock=time.monotonic, sleep=None):
+        self.actions = actions
+        self.metrics = metrics
+        self.on_step = on_step   # on_step(entry) after each fired step
+        self.clock = clock
+        self.sleep = sleep
+        self.sequence = ()
+        self.current_step = 0
+        self.start_time = None   # on self.clock
+        self.origin = 0.0        # sequence time of the first step
+        self.log = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, sequence):
+        '''Run the sequence on the sequencer thread.'''
+        self._prepare(sequence)
+        self._thread = threading.Thread(target=self._run, name="sequencer", daemon=True)
+        self._thread.start()
+
+    def run(self, sequence):
+        '''Run the sequence to the end in the calling thread.'''
+        self._prepare(sequence)
+        self._run()
+
+    def _prepare(self, sequence):
+        self.stop()
+        sequence = tuple(sequence)
+        if not all(isinstance(step, Step) for step in sequence):
+            sequence = compile_sequence(sequence, self.actions)
+        self.sequence = sequence
+        self.origin = sequence[0].time if sequence else 0.0
+        self.current_step = 0
+        self.log = []
+        self._stop.clear()
+        self.start_time = self.clock()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        # an action (BLP_Abort) may stop the sequence from the sequencer thread itself
+        if self.running and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            while self.current_step < len(self.sequence) and not self._stop.is_set():
+                self._wait_until(self._deadline(self.sequence[self.current_step]))
+                fired = self._fire_due()
+                for entry in fired:
+                    if 'error' in entry:
+                        print(f"Error executing {entry['function']}: {entry['error']}")
+                    else:
+                        print(f"Executed {entry['function']} at {entry['actual']:.3f}s: {entry['result']}")
+                if fired and 'error' in fired[-1]:
+                    break
+        finally:
+            if self.log:
+                self.report()
+
+    def _wait_until(self, deadline):
+        if self.sleep is not None:
+            self.sleep(max(0.0, deadline - self.clock()))
+            return
+        remaining = deadline - self.clock()
+        if remaining > self.SPIN and self._stop.wait(remaining - self.SPIN):
+            return
+        while self.clock() < deadline:
+            pass
+
+    def _deadline(self, step):
+        return self.start_time + (step.time - self.origin)
+
+    def _fire_due(self):
+        '''Fire every step whose deadline has passed; returns their log entries.'''
+        fired = []
+        while (self.current_step < len(self.sequence) and not self._stop.is_set()
+               and self._deadline(self.sequence[self.current_step]) <= self.clock()):
+            step = self.sequence[self.current_step]
+            self.current_step += 1
+            actual = self.clock() - self.start_time + self.origin
+            entry = {'step': self.current_step - 1, 'function': step.function,
+                     'intended': step.time, 'actual': actual, 'late': actual - step.time}
+            try:
+                entry['result'] = step.action() if step.action is not None else None
+            except Exception as e:
+                entry['error'] = e
+            entry['duration'] = self.clock() - self.start_time + self.origin - actual
+            self.log.append(entry)
+            fired.append(entry)
+            if self.metrics is not None:
+                self.metrics.record('step late', entry['late'])
+            if self.on_step is not None:
+                self.on_step(entry)
+            if 'error' in entry:
+                break
+        return fired
+
+    def offset(self, first, second):
+        '''(intended, actual) seconds from the first `first` step to the next `second` step.'''
+        a = next((e for e in self.log if e['function'] == first), None)
+        if a is None:
+            return None
+        b = next((e for e in self.log if e['function'] == second and e['step'] > a['step']), None)
+        if b is None:
+            return None
+        return b['intended'] - a['intended'], b['actual'] - a['actual']
+
+    def report(self):
+        print("step  intended    actual   late ms  function")
+        for e in self.log:
+            print(f"{e['step']:>4} {e['intended']:9.3f} {e['actual']:9.3f} {e['late'] * 1000:9.3f}  {e['function']}")
+        late = sorted(e['late'] * 1000 for e in self.log)
+        print(f"steps: n={len(late)} mean late={sum(late) / len(late):.3f} ms "
+              f"p95={late[min(len(late) - 1, int(0.95 * len(late)))]:.3f} ms max={late[-1]:.3f} ms")
+        for first, second in CHECKED_OFFSETS:
+            offsets = self.offset(first, second)
+            if offsets is not None:
+                intended, actual = offsets
+                print(f"{first} -> {second}: intended {intended:.3f} s, actual {actual:.3f} s "
+                      f"(error {(actual - intended) * 1000:+.3f} ms)")
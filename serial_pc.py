@@ -1,11 +1,15 @@
 #Creator: Izuka
 import socket
 
+from frames import StreamFramer, length_prefixed
+
 ESP32_MAC = "40:91:51:2C:FE:FE"  # Replace with actual ESP32 MAC
 RFCOMM_PORT = 1
 
 
 class BT:
+    # one StreamFramer per connected socket
+    framers = {}
 
     def connect_to_esp32():
         print(f"🔗 Connecting to ESP32 at {ESP32_MAC}...")
@@ -21,28 +25,29 @@ class BT:
             return None
 
     def send_data(sock, data_packet):
-        indx = 0
-        for i in data_packet:
-            """Send an integer array formatted as a packet, ignoring NoneType values."""
-            print(data_packet[indx])
-            packet_str = ",".join(map(str, data_packet)) + "\n"  # Convert to comma-separated string\
-            indx += 1
-        print("SIZE = " + str(len(packet_str.encode())))
-        sock.sendall(packet_str.encode())  # Send the encoded packet
-        print("📤 Sent Data Packet:", packet_str)
+        """Send an integer array as one length-prefixed comma-separated packet."""
+        packet_str = ",".join(map(str, data_packet))  # Convert to comma-separated string
+        sock.sendall(length_prefixed(packet_str.encode()))  # Send the encoded packet
 
     def receive_data(sock):
-        """Receive full message from ESP32."""
+        """
+        Receive the next full message from ESP32, reassembled however RFCOMM
+        split or merged it. Returns a memoryview of the message, valid until
+        the next call; parse with e.g. BT.parse_values().
+        """
+        framer = BT.framers.get(sock)
+        if framer is None:
+            framer = BT.framers[sock] = StreamFramer(sock)
         try:
-            data = sock.recv(1024).decode().strip()  # Read incoming data
-            if data:
-                print("📩 Received from ESP32:", data)
-                parsed_values = list(map(int, data.split(",")))  # Convert received data to integers
-                print("✅ Parsed Values:", parsed_values)
+            return framer.recv_frame()
         except Exception as e:
+            BT.framers.pop(sock, None)
             print(f"⚠️ Error receiving data: {e}")
+            return None
 
-        return data
+    def parse_values(frame):
+        """Comma-separated integers of one message."""
+        return [int(v) for v in bytes(frame).split(b",")]
 
 
 '''
@@ -0,0 +1,155 @@
+'''
+Run test sequences on a virtual clock, faster than real time.
+
+The sequence goes through the same daemon.Stand, Sequencer, abort and
+Telemetry command path as a real run, against an arduino_emulator device
+behind a synchronous link.  Every wait jumps the virtual clock forward
+instead of sleeping, so a ten minute sequence finishes in milliseconds,
+and the device's record of what reached it is the command timeline.
+
+    python simulation.py Launc_Manual.csv "test sequence/BLP_Dry_Test.csv"
+    python simulation.py --jobs 8 variants/*.csv      # exit 1 if any fail
+'''
+
+import argparse
+import contextlib
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import frames
+from arduino_emulator import EmulatedDevice
+from daemon import Stand
+from pycode import Telemetry, System_Health
+from sequencer import SequenceError
+
+
+class VirtualClock:
+    '''Simulated monotonic time in seconds; sleep() advances it instantly.'''
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+class SimulatedLink:
+    '''
+    Synchronous stand-in for the UART module.  Polls and commands go
+    straight to an EmulatedDevice and the clock advances by the time the
+    bytes would take on the wire, plus the device's response delay.
+    '''
+
+    def __init__(self, device, clock):
+        self.device = device
+        self.clock = clock
+        self.command_seq = 0
+
+    def _write(self, data):
+        self.clock.sleep(len(data) * 10 / self.device.baud_rate)
+        return self.device.feed(data)
+
+    def _reply(self, replies):
+        if not replies:
+            raise frames.FrameError("device did not reply")
+        self.clock.sleep(self.device.reply_delay(replies[0]))
+        return replies[0]
+
+    def receive_response(self):
+        seq, device_ms, values = frames.decode_telemetry(self._reply(self._write(frames.BULK_POLL)))
+        return list(values)
+
+    def send_command(self, packet, payload=None):
+        start = self.clock()
+        self.command_seq = (self.command_seq + 1) & 0xFFFF
+        replies = self._write(frames.encode_command(self.command_seq, packet, payload))
+        wire = self.clock() - start
+        acked = frames.decode_ack(self._reply(replies))
+        if acked != self.command_seq:
+            raise frames.FrameError(f"ack for command {acked}, expected {self.command_seq}")
+        return self.command_seq, wire, self.clock() - start
+
+    def send_message(self, message):
+        self._write(frames.encode_legacy_command(message))
+
+    def reconnect(self):
+        pass
+
+
+def simulate(steps, baud_rate=115200, response_delay=0.0, seed=0):
+    '''
+    Run `steps`, a sequence CSV path or (time, function) pairs, to the end
+    on a virtual clock.  Returns the compiled plan, the sequencer's step
+    log and every command the device received as (sequence time, bytes).
+    Raises SequenceError if the sequence does not compile.
+    '''
+    clock = VirtualClock()
+    device = EmulatedDevice(baud_rate=baud_rate, response_delay=response_delay,
+                            seed=seed, clock=clock)
+    tel = Telemetry(System_Health, link=SimulatedLink(device, clock),
+                    abort_options={'clock': clock, 'sleep': clock.sleep, 'threaded': False})
+    stand = Stand(tel, log_path=None, acquire=False, clock=clock, sleep=clock.sleep)
+    stand.run_sequence(steps, block=True)
+
+    seq = stand.sequencer
+    commands = [(t - seq.start_time + seq.origin, payload) for t, payload in device.commands]
+    return {'plan': seq.sequence, 'log': seq.log, 'commands': commands,
+            'valves': dict(stand.valve_status), 'duration': clock() - seq.start_time}
+
+
+def format_timeline(result):
+    '''The commands in time order, each with the step that sent it.'''
+    lines = ["     T+ (s)  step         command"]
+    log = result['log']
+    for t, payload in result['commands']:
+        # the last step to start at or before the command sent it
+        step = next((e for e in reversed(log) if e['actual'] <= t), None)
+        name = step['function'] if step else '-'
+        lines.append(f"{t:11.4f}  {name:<12} {payload.decode('latin1')}")
+    late = max((abs(e['late']) for e in log), default=0.0)
+    lines.append(f"{len(result['commands'])} commands, {len(log)} steps, "
+                 f"{result['duration']:.3f} s simulated, worst step error {late * 1000:.3f} ms")
+    lines.append(f"final valves: {result['valves']}")
+    return "\n".join(lines)
+
+
+def _simulate_file(path, options):
+    '''Worker for main(): (ok, report text), with the run's console output captured.'''
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            result = simulate(path, **options)
+    except SequenceError as e:
+        return False, f"rejected:\n{e}"
+    except Exception as e:
+        return False, f"failed: {type(e).__name__}: {e}\n{out.getvalue()}"
+    return True, format_timeline(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sequences', nargs='+', help="sequence CSV files")
+    parser.add_argument('--jobs', type=int, default=None, help="parallel runs (default: CPU count)")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--delay', type=float, default=0.0, help="device response delay (s)")
+    args = parser.parse_args()
+
+    options = {'baud_rate': args.baud, 'response_delay': args.delay}
+    failed = 0
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = [pool.submit(_simulate_file, path, options) for path in args.sequences]
+        for path, future in zip(args.sequences, futures):
+            ok, text = future.result()
+            failed += not ok
+            print(f"== {path}\n{text}\n")
+    print(f"{len(args.sequences) - failed}/{len(args.sequences)} sequences ran")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
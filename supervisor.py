@@ -0,0 +1,162 @@
+'''
+Supervised telemetry link: survives USB / radio dropouts mid-test.
+
+Supervisor wraps anything with receive_response() / send_command() /
+reconnect() (the UART module or a transport.Link).  A corrupt or
+out-of-sync frame (a ValueError such as frames.FrameError) is a dropped
+sample: the link is polled again and resynchronizes on the next valid
+frame, without reopening the port, which would reset the Arduino.  Only
+after RESYNC_LIMIT bad polls in a row, or when the link itself fails (an
+OSError, which covers serial.SerialException, UART.LinkDropped and link
+timeouts), is it reopened, with exponential backoff; then one GAP_SAMPLE of
+NaNs is handed back first so the record shows an explicit break instead of
+the GUI loop crashing.  Every outage is logged in `gaps` and its recovery
+time in the Metrics passed in.
+
+A command whose ack is garbled or mismatched is sent once more on the open
+port; one that fails on the link reconnects it first.  A packet carries the
+whole valve state, so sending it twice is harmless.  If the retry fails
+too, the error goes to the caller (a button, the sequencer, the abort
+thread) instead of waiting out a long outage there.
+
+The acquisition thread and command senders share one reconnect: whoever
+fails second waits for the first reopen instead of reopening again.
+'''
+
+import math
+import threading
+import time
+
+CHANNEL_COUNT = 6
+GAP_SAMPLE = [math.nan] * CHANNEL_COUNT
+
+# bad frames in a row that are taken as a dead link rather than line noise
+RESYNC_LIMIT = 3
+
+
+def is_gap(values):
+    return bool(values) and all(v != v for v in values)
+
+
+class Supervisor:
+    def __init__(self, link, metrics=None, health=None, backoff=0.25, max_backoff=4.0):
+        self.link = link
+        self.metrics = metrics
+        self.health = health
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # one dict per outage: start, end, recovery (s), attempts, missed samples
+        self.gaps = []
+        self.stopped = threading.Event()
+        self._resumed = None
+        self._last_good = None
+        self._interval = None   # running mean time between good samples
+        self.dropped = 0        # corrupt frames skipped by resynchronizing
+        self._reconnect_lock = threading.Lock()
+        self._generation = 0    # completed reconnects
+
+    def __getattr__(self, name):
+        # everything else (send_message, connect, ...) goes straight to the link
+        return getattr(self.link, name)
+
+    def send_command(self, packet, payload=None):
+        generation = self._generation
+        try:
+            return self.link.send_command(packet, payload)
+        except ValueError as e:
+            # garbled or mismatched ack: the port is fine, send it again
+            print(f"Command not acked: {e}; resending")
+            began = time.monotonic()
+            reopen = False
+        except OSError as e:
+            print(f"Command failed: {e}; reconnecting")
+            self._set_health('dropped')
+            began = time.monotonic()
+            reopen = True
+        try:
+            if reopen:
+                self._reconnect(generation)
+            result = self.link.send_command(packet, payload)
+        except Exception as e:
+            print(f"Command retry failed: {e}")
+            raise
+        if self.metrics is not None:
+            self.metrics.record('command recovery', time.monotonic() - began)
+        if reopen:
+            self._set_health('good')
+        return result
+
+    def receive_response(self):
+        if self._resumed is not None:
+            values, self._resumed = self._resumed, None
+            return values
+        generation = self._generation
+        for _ in range(RESYNC_LIMIT):
+            try:
+                values = self.link.receive_response()
+            except ValueError as e:
+                # a dropped sample: poll again, the link resyncs on the next frame
+                self.dropped += 1
+                error = e
+                continue
+            except OSError as e:
+                error = e
+                break
+            self._mark_good()
+            return values
+        return self._recover(error, generation)
+
+    def _reconnect(self, generation):
+        '''Reopen the link unless another thread has since the caller's failure.'''
+        with self._reconnect_lock:
+            if self._generation == generation:
+                try:
+                    self.link.reconnect()
+                finally:
+                    self._generation += 1
+
+    def _mark_good(self):
+        now = time.monotonic()
+        if self._last_good is not None:
+            dt = now - self._last_good
+            self._interval = dt if self._interval is None else 0.9 * self._interval + 0.1 * dt
+        self._last_good = now
+
+    def _set_health(self, status):
+        if self.health is not None:
+            self.health.py_stats['link'] = status
+
+    def _recover(self, error, generation):
+        print(f"Link dropped: {error}")
+        self._set_health('dropped')
+        start = time.time()
+        began = time.monotonic()
+        lost_from = self._last_good if self._last_good is not None else began
+        delay = self.backoff
+        attempts = 0
+        while not self.stopped.is_set():
+            attempts += 1
+            try:
+                self._reconnect(generation)
+                # the first valid sample after reopening is the resync point
+                self._resumed = self.link.receive_response()
+                break
+            except Exception as e:
+                generation = self._generation
+                print(f"Reconnect attempt {attempts} failed: {e}")
+                self.stopped.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+        recovery = time.monotonic() - began
+        missed = 0
+        if self._interval:
+            missed = max(0, round((time.monotonic() - lost_from) / self._interval) - 1)
+        self.gaps.append({'start': start, 'end': time.time(), 'recovery': recovery,
+                          'attempts': attempts, 'missed': missed})
+        if self.metrics is not None:
+            self.metrics.record('link recovery', recovery)
+        if self._resumed is not None:
+            self._set_health('good')
+            self._last_good = time.monotonic()
+            print(f"Link recovered after {recovery:.2f} s, ~{missed} samples lost")
+        return list(GAP_SAMPLE)
@@ -0,0 +1,473 @@
+'''
+Async transports for the test stand link.
+
+Every backend exposes the same small interface - open(), close(), write(),
+read(n), readline(), reset_input() - with pyserial-style timeouts: reads
+return whatever arrived before the deadline instead of raising, so the
+framing code treats a silent link exactly like UART.py does.
+
+    SerialTransport      USB serial to the Arduino (replaces UART.py globals)
+    BluetoothTransport   RFCOMM to the ESP32 (replaces serial_pc.BT)
+    TcpTransport         Wifi to the pad (replaces pycode.Wifi_Host)
+    LoopbackTransport    in-memory stand-in backed by arduino_emulator
+
+TelemetryLink runs the poll / command protocol over any of them, and Link
+wraps that in a private event loop thread with blocking receive_response()
+/ send_command() calls.  The UART module is itself a Link over a
+SerialTransport, so the default path and Telemetry(sys,
+link=Link(TcpTransport(host, port))) share one protocol implementation.
+'''
+
+import asyncio
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+
+import frames
+
+# poll byte for each channel, in receive_response() order
+CHANNEL_POLLS = (b'5', b'6', b'7', b'8', b'A', b'&')
+
+# legacy firmware reads commands a piece at a time: wait this long after
+# each "[", slot and ","
+LEGACY_PACING = 0.05
+
+# the Arduino resets when its serial port opens; its bootloader runs this long
+SERIAL_SETTLE = 2.0
+
+
+class Transport:
+    # seconds open() waits for the device to come up before it is polled
+    settle = 0.0
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self.is_open = False
+        self._rx = bytearray()
+        self._waiter = None
+
+    # -- called by backends on the event loop --
+    def _feed(self, data):
+        self._rx += data
+        self._wake()
+
+    def _lost(self, exc=None):
+        self.is_open = False
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _wait_for(self, ready):
+        deadline = time.monotonic() + self.timeout
+        loop = asyncio.get_running_loop()
+        while not ready() and self.is_open:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._waiter = loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, remaining)
+            except asyncio.TimeoutError:
+                return
+            finally:
+                self._waiter = None
+
+    # -- public interface --
+    async def open(self):
+        raise NotImplementedError
+
+    async def close(self):
+        self.is_open = False
+
+    async def write(self, data):
+        raise NotImplementedError
+
+    def reset_input(self):
+        self._rx.clear()
+
+    async def read(self, n):
+        await self._wait_for(lambda: len(self._rx) >= n)
+        data = bytes(self._rx[:n])
+        del self._rx[:n]
+        return data
+
+    async def readline(self):
+        await self._wait_for(lambda: b'\n' in self._rx)
+        end = self._rx.find(b'\n') + 1 or len(self._rx)
+        data = bytes(self._rx[:end])
+        del self._rx[:end]
+        return data
+
+
+class _StreamProtocol(asyncio.Protocol):
+    def __init__(self, transport):
+        self.owner = transport
+
+    def data_received(self, data):
+        self.owner._feed(data)
+
+    def connection_lost(self, exc):
+        self.owner._lost(exc)
+
+
+class _SocketTransport(Transport):
+    '''Backends whose link is a connected stream socket.'''
+
+    def __init__(self, timeout=1.0):
+        super().__init__(timeout)
+        self._transport = None
+
+    async def _connect(self, sock=None, host=None, port=None):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await asyncio.wait_for(
+            loop.create_connection(lambda: _StreamProtocol(self), host, port, sock=sock),
+            self.timeout)
+        self.is_open = True
+
+    async def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self.is_open = False
+
+    async def write(self, data):
+        self._transport.write(data)
+
+
+class TcpTransport(_SocketTransport):
+    def __init__(self, host, port, timeout=1.0):
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+
+    async def open(self):
+        await self._connect(host=self.host, port=self.port)
+
+
+class BluetoothTransport(_SocketTransport):
+    def __init__(self, mac="40:91:51:2C:FE:FE", channel=1, timeout=1.0):
+        super().__init__(timeout)
+        self.mac = mac
+        self.channel = channel
+
+    async def open(self):
+        sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+        sock.setblocking(False)
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (self.mac, self.channel)), self.timeout)
+        except BaseException:
+            sock.close()
+            raise
+        await self._connect(sock=sock)
+
+
+class SerialTransport(Transport):
+    '''
+    pyserial port in non-blocking mode, read and written through the event
+    loop's selector, so a full output buffer never blocks the loop.
+    '''
+
+    def __init__(self, port='/dev/ttyACM0', baud_rate=9600, timeout=1.0, settle=SERIAL_SETTLE):
+        super().__init__(timeout)
+        self.port = port
+        self.baud_rate = baud_rate
+        self.settle = settle
+        self.ser = None
+
+    async def open(self):
+        import serial
+        self.ser = serial.Serial(self.port, self.baud_rate, timeout=0, write_timeout=self.timeout)
+        asyncio.get_running_loop().add_reader(self.ser.fileno(), self._on_readable)
+        self.is_open = True
+        if self.settle:
+            # anything sent now goes to the bootloader, and probes would fail
+            await asyncio.sleep(self.settle)
+            self.reset_input()
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.ser.fileno(), 4096)
+        except OSError as e:
+            self._close_port()
+            self._lost(e)
+            return
+        if data:
+            self._feed(data)
+        else:
+            self._close_port()
+            self._lost()
+
+    def _close_port(self):
+        if self.ser is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self.ser.fileno())
+            except (RuntimeError, ValueError, OSError):
+                pass
+            self.ser.close()
+            self.ser = None
+
+    async def close(self):
+        self._close_port()
+        self.is_open = False
+
+    def reset_input(self):
+        super().reset_input()
+        if self.ser is not None:
+            self.ser.reset_input_buffer()
+
+    async def write(self, data):
+        # pyserial opens the port O_NONBLOCK: write what fits, then wait for room
+        import serial
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.ser.fileno(), view):]
+            except BlockingIOError:
+                pass
+            except OSError as e:
+                self._close_port()
+                self._lost(e)
+                raise serial.SerialException(f"write failed: {e}") from e
+            if view and not await self._writable(deadline):
+                raise serial.SerialTimeoutException("Write timeout")
+
+    async def _writable(self, deadline):
+        loop = asyncio.get_running_loop()
+        fd = self.ser.fileno()
+        ready = loop.create_future()
+        loop.add_writer(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, max(0.0, deadline - loop.time()))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_writer(fd)
+
+
+class LoopbackTransport(Transport):
+    '''
+    In-memory link to an arduino_emulator.EmulatedDevice, replies delayed
+    by the device's configured latency and baud rate.
+    '''
+
+    def __init__(self, device=None, timeout=1.0):
+        super().__init__(timeout)
+        if device is None:
+            from arduino_emulator import EmulatedDevice
+            device = EmulatedDevice(baud_rate=115200)
+        self.device = device
+
+    async def open(self):
+        self.is_open = True
+
+    async def write(self, data):
+        loop = asyncio.get_running_loop()
+        for reply in self.device.feed(data):
+            loop.call_later(self.device.reply_delay(reply), self._feed, reply)
+
+
+class TelemetryLink:
+    '''
+    The stand's poll / command protocol over any Transport.  open() probes
+    whether the firmware answers bulk polls and acks framed commands, and
+    the link falls back to per-channel polls and paced per-byte commands
+    for older firmware; every reopen probes again.
+    '''
+
+    def __init__(self, transport, bulk=True, framed=True):
+        self.transport = transport
+        self.bulk = bulk
+        self.framed = framed
+        self.bulk_supported = None
+        self.framed_supported = None
+        self.command_seq = 0
+        self._lock = None
+
+    def _get_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def receive_frame(self):
+        '''(seq, device_ms, values) of one bulk poll.'''
+        async with self._get_lock():
+            self._check_open()
+            return await self._poll_frame()
+
+    async def _poll_frame(self):
+        t = self.transport
+        t.reset_input()
+        await t.write(frames.BULK_POLL)
+        buf = await t.read(frames.TELEMETRY_FRAME_SIZE)
+        start = buf.find(frames.SYNC)
+        if start > 0:
+            buf = buf[start:] + await t.read(start)
+        elif start < 0:
+            raise frames.FrameError("no telemetry frame received")
+        return frames.decode_telemetry(buf)
+
+    async def receive_channels(self):
+        t = self.transport
+        t.reset_input()
+        rx_data = []
+        for poll in CHANNEL_POLLS:
+            await t.write(poll)
+            rx_data.append(float((await t.readline()).decode('latin1').strip()))
+        return rx_data
+
+    def _check_open(self):
+        if not self.transport.is_open:
+            raise ConnectionError("link is not open")
+
+    async def receive_response(self):
+        '''One sample of every channel, [OPD_01, OPD_02, EPD_01, FPD_01, FPD_02, THRUST].'''
+        async with self._get_lock():
+            self._check_open()
+            if self.bulk and self.bulk_supported:
+                seq, device_ms, values = await self._poll_frame()
+                return list(values)
+            return await self.receive_channels()
+
+    async def open(self):
+        '''Open the transport and probe which protocol the firmware speaks.'''
+        await self.transport.open()
+        async with self._get_lock():
+            self.bulk_supported = self.framed_supported = None
+            if self.bulk:
+                await self._probe_bulk()
+            if self.framed:
+                await self._probe_framed()
+
+    async def _probe_bulk(self):
+        try:
+            await self._poll_frame()
+            self.bulk_supported = True
+        except frames.FrameError:
+            self.bulk_supported = False
+            print("Bulk poll not answered, using per-channel polling")
+
+    async def _probe_framed(self):
+        t = self.transport
+        seq, frame = frames.probe_command()
+        t.reset_input()
+        await t.write(frame)
+        try:
+            self.framed_supported = frames.decode_ack(await t.read(frames.ACK_FRAME_SIZE)) == seq
+        except frames.FrameError:
+            self.framed_supported = False
+        if not self.framed_supported:
+            print("Command frames not acked, using per-byte commands")
+
+    async def send_command(self, packet, payload=None):
+        '''
+        Send a whole data packet and wait for its ack.  payload is the
+        packet's precomputed frames.encode_legacy_command().  Returns (seq,
+        wire_latency, ack_latency) in seconds; seq and ack_latency are None
+        when the packet went out on the legacy protocol.
+        '''
+        t = self.transport
+        async with self._get_lock():
+            self._check_open()
+            start = time.perf_counter()
+            if self.framed and self.framed_supported:
+                self.command_seq = (self.command_seq + 1) & 0xFFFF
+                seq = self.command_seq
+                t.reset_input()
+                await t.write(frames.encode_command(seq, packet, payload))
+                wire = time.perf_counter() - start
+                acked = frames.decode_ack(await t.read(frames.ACK_FRAME_SIZE))
+                if acked != seq:
+                    raise frames.FrameError(f"ack for command {acked}, expected {seq}")
+                return seq, wire, time.perf_counter() - start
+            await self._send_legacy(packet)
+            return None, time.perf_counter() - start, None
+
+    async def send_message(self, message):
+        async with self._get_lock():
+            self._check_open()
+            await self._send_legacy(message)
+
+    async def _send_legacy(self, packet):
+        '''The per-byte protocol: "[" slot "," for each slot, paced for the firmware.'''
+        for slot in packet:
+            for piece in (b'[', str(slot).encode(), b','):
+                await self.transport.write(piece)
+                await asyncio.sleep(LEGACY_PACING)
+
+
+class Link:
+    '''
+    Blocking facade over a TelemetryLink running on its own event loop
+    thread, for Telemetry and the UART module; every call is bounded by
+    `timeout` so a dead link raises instead of hanging the caller.
+    '''
+
+    def __init__(self, transport, timeout=2.0, **options):
+        self.transport = transport
+        self.protocol = TelemetryLink(transport, **options)
+        self.timeout = timeout
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever,
+                                            name="link", daemon=True)
+            self._thread.start()
+            self.call(self.protocol.open(), self._open_timeout())
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            try:
+                self.call(self.transport.close())
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join(self.timeout)
+                self.loop.close()
+                self._thread = None
+
+    def reconnect(self):
+        self.call(self.transport.close())
+        self.call(self.protocol.open(), self._open_timeout())
+
+    def _open_timeout(self):
+        # the device's settle time, then a bulk and a framed probe that may each time out
+        return self.timeout + self.transport.settle + 2 * self.transport.timeout
+
+    def call(self, coro, timeout=None):
+        if self._thread is None:
+            coro.close()
+            raise RuntimeError("link not started")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def receive_response(self):
+        return self.call(self.protocol.receive_response())
+
+    def receive_frame(self):
+        return self.call(self.protocol.receive_frame())
+
+    def _legacy_time(self, packet):
+        return 3 * LEGACY_PACING * len(packet)
+
+    def send_command(self, packet, payload=None):
+        # on legacy firmware the command is paced out, which takes longer than a poll
+        return self.call(self.protocol.send_command(packet, payload),
+                         self.timeout + self._legacy_time(packet))
+
+    def send_message(self, message):
+        self.call(self.protocol.send_message(message), self.timeout + self._legacy_time(message))